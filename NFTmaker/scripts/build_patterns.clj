@@ -0,0 +1,139 @@
+;; Compile Patterning patterns against a cached build of the Patterning library.
+;;
+;; Usage (from the project root):
+;;   lein run -m clojure.main NFTmaker/scripts/build_patterns.clj [options] --library
+;;   lein run -m clojure.main NFTmaker/scripts/build_patterns.clj [options] chita triangles ...
+;;
+;; Options:
+;;   --build nft|slide   which set of compiler options to use (default nft)
+;;   --source-dir DIR    where <name>.cljs is found (default depends on --build)
+;;   --js-dir DIR        write <name>.js (and any source map) into DIR
+;;   --output-dir DIR    compiler scratch dir (default: the shared library cache)
+;;
+;; --library compiles src/cljc and src/cljs once into the build's library
+;; cache under target/. Pattern builds reuse that output, so the ClojureScript
+;; compiler finds the library namespaces already up to date and only compiles
+;; the pattern namespace itself. All the patterns named on one command line
+;; are built in the same JVM with one shared compiler environment.
+;;
+;; Builds that run at the same time must each pass their own --output-dir and
+;; --js-dir. A private output dir is seeded with a copy of the library cache
+;; (keeping modification times, so the copy counts as up to date) and the
+;; shared cache itself is only ever written by --library or by builds that
+;; don't ask for a private output dir.
+
+(ns build-patterns
+  (:require [cljs.build.api :as build]
+            [cljs.env :as env]
+            [clojure.java.io :as io]
+            [clojure.string :as string]))
+
+(def library-sources ["src/cljc" "src/cljs"])
+
+;; Options that change the JS the compiler emits must be the same for the
+;; library build and the pattern builds, or the cached library is recompiled.
+(def builds
+  {"nft" {:library-dir "target/nft-library"
+          :source-dir "NFTmaker/patterns"
+          :js-dir (fn [pattern-name] (str "NFTmaker/dist/patterns/" pattern-name))
+          :compiler {:preloads '[patterning.canvasview]
+                     :source-map false
+                     :closure-defines {"goog.DEBUG" false}
+                     :elide-asserts true}
+          :source-map? false}
+   "slide" {:library-dir "target/slide-library"
+            :source-dir "presentation/patterns"
+            :js-dir (fn [_] "presentation/slides")
+            :compiler {:preloads '[patterning.canvasview]
+                       :pretty-print true
+                       :output-wrapper false}
+            :source-map? true}})
+
+(defn parse-args [args]
+  (loop [opts {:build "nft" :names []} [arg & more :as args] args]
+    (cond
+      (empty? args) opts
+      (= arg "--library") (recur (assoc opts :library? true) more)
+      (= arg "--build") (recur (assoc opts :build (first more)) (rest more))
+      (= arg "--source-dir") (recur (assoc opts :source-dir (first more)) (rest more))
+      (= arg "--js-dir") (recur (assoc opts :js-dir (first more)) (rest more))
+      (= arg "--output-dir") (recur (assoc opts :output-dir (first more)) (rest more))
+      :else (recur (update opts :names conj arg) more))))
+
+(defn copy-tree
+  "Copy every file under from into to, keeping modification times."
+  [from to]
+  (let [root (.toPath (io/file from))]
+    (doseq [f (file-seq (io/file from)) :when (.isFile f)]
+      (let [target (io/file to (str (.relativize root (.toPath f))))]
+        (io/make-parents target)
+        (io/copy f target)
+        (.setLastModified target (.lastModified f))))))
+
+(defn compile-library [build-config compiler-env]
+  (let [library-dir (:library-dir build-config)]
+    (println "Compiling Patterning library into" library-dir)
+    (build/build (apply build/inputs library-sources)
+                 (merge (:compiler build-config)
+                        {:output-dir library-dir
+                         :output-to (str library-dir "/library.js")
+                         :optimizations :none})
+                 compiler-env)))
+
+(defn pattern-options [build-config output-dir js-dir pattern-name]
+  (let [output-to (str js-dir "/" pattern-name ".js")]
+    (merge (:compiler build-config)
+           {:output-dir output-dir
+            :output-to output-to
+            :main (symbol pattern-name)
+            :optimizations :simple}
+           (when (:source-map? build-config)
+             {:source-map (str output-to ".map")}))))
+
+(defn compile-pattern
+  "Compile one pattern. Returns true on success."
+  [build-config compiler-env output-dir source-dir js-dir pattern-name]
+  (let [source (str source-dir "/" pattern-name ".cljs")]
+    (if-not (.exists (io/file source))
+      (do (println (str "ERROR: Pattern source not found: " source))
+          false)
+      (try
+        (println "Compiling pattern" pattern-name)
+        (build/build (apply build/inputs (conj library-sources source))
+                     (pattern-options build-config output-dir js-dir pattern-name)
+                     compiler-env)
+        (println (str "OK: " pattern-name))
+        true
+        (catch Exception e
+          (println (str "ERROR: Failed to compile " pattern-name ": " (.getMessage e)))
+          false)))))
+
+(defn -main [& args]
+  (let [{:keys [build library? names] :as opts} (parse-args args)
+        build-config (or (builds build)
+                         (do (println (str "ERROR: Unknown build " build
+                                           ", expected one of " (string/join ", " (keys builds))))
+                             (System/exit 1)))
+        library-dir (:library-dir build-config)
+        output-dir (or (:output-dir opts) library-dir)
+        source-dir (or (:source-dir opts) (:source-dir build-config))
+        compiler-env (env/default-compiler-env (:compiler build-config))]
+    (cond
+      library?
+      (compile-library build-config compiler-env)
+
+      (not= output-dir library-dir)
+      (when (and (.exists (io/file library-dir))
+                 (not (.exists (io/file output-dir))))
+        (copy-tree library-dir output-dir))
+
+      (not (.exists (io/file library-dir)))
+      (compile-library build-config compiler-env))
+    (let [results (doall (for [pattern-name names]
+                           (compile-pattern build-config compiler-env output-dir source-dir
+                                            (or (:js-dir opts) ((:js-dir build-config) pattern-name))
+                                            pattern-name)))]
+      (shutdown-agents)
+      (System/exit (if (every? true? results) 0 1)))))
+
+(apply -main *command-line-args*)
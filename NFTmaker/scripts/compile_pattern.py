@@ -5,14 +5,19 @@ import sys
 import shutil
 import subprocess
 import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import re
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'scripts'))
+import build_timing
+
 def ensure_dirs():
     """Ensure required directories exist"""
     os.makedirs("NFTmaker/patterns", exist_ok=True)
     os.makedirs("NFTmaker/dist/patterns", exist_ok=True)
-    os.makedirs("target/pattern-build", exist_ok=True)
+    os.makedirs("target", exist_ok=True)
 
 def ensure_dir(directory):
     """Ensure a directory exists, creating it if necessary."""
@@ -35,138 +40,266 @@ def copy_js_files(pattern_dir):
         return False
     
     try:
-        shutil.copy2(fxhash_src, pattern_dir / "fxhash.min.js")
-        shutil.copy2(random_gen_src, pattern_dir / "fxhash_random_generator.js")
+        with build_timing.phase('file-copy'):
+            shutil.copy2(fxhash_src, pattern_dir / "fxhash.min.js")
+            shutil.copy2(random_gen_src, pattern_dir / "fxhash_random_generator.js")
         return True
     except Exception as e:
         print(f"Error copying FX(hash) files: {str(e)}")
         return False
 
-def compile_pattern(pattern_file, pattern_name):
-    """Compile a pattern file into a standalone JS bundle"""
-    # Ensure directories exist
+BUILD_SCRIPT = "NFTmaker/scripts/build_patterns.clj"
+LIBRARY_BUILD_DIR = Path("target/nft-library")
+WORKSPACE_ROOT = Path("target/builds")
+
+def run_pattern_build(args):
+    """Run build_patterns.clj in one JVM. Returns (success, error_message)."""
+    try:
+        # Includes starting the JVM, which is most of the time for a single pattern
+        with build_timing.phase('cljs-compile'):
+            result = subprocess.run(["lein", "run", "-m", "clojure.main", BUILD_SCRIPT] + list(args),
+                                    capture_output=True,
+                                    text=True)
+    except FileNotFoundError as e:
+        return False, f"Could not run lein: {e}"
+    print(result.stdout, end='')
+    if result.returncode != 0:
+        print(result.stderr, end='')
+        return False, f"Compilation failed: {result.stderr or result.stdout}"
+    return True, None
+
+def precompile_library(clean=False):
+    """Compile the Patterning library once into target/ for later pattern builds"""
     ensure_dirs()
-    
-    success = False
-    error_message = None
-    
-    # Create pattern directory if it doesn't exist
-    pattern_dir = Path("NFTmaker/patterns")
-    pattern_dir.mkdir(exist_ok=True)
-    
-    # Create pattern-specific output directory
+    if clean:
+        clean_library_build()
+    return run_pattern_build(["--library"])
+
+def clean_library_build():
+    """Throw away the cached library build so the next compile starts from scratch"""
+    if LIBRARY_BUILD_DIR.exists():
+        shutil.rmtree(LIBRARY_BUILD_DIR)
+
+def package_pattern(pattern_name):
+    """Write index.html and the FX(hash) files next to a compiled pattern. Returns (success, error_message)."""
+    pattern_output_dir = Path(f"NFTmaker/dist/patterns/{pattern_name}")
+    js_file = pattern_output_dir / f"{pattern_name}.js"
+
+    if not js_file.exists():
+        error_message = f"Compiled JS file not found at {js_file}"
+        print(f"Error: {error_message}")
+        return False, error_message
+
+    # Read the HTML template
+    template_path = Path(os.path.dirname(os.path.abspath(__file__))) / "pattern_template.html"
+
+    if not template_path.exists():
+        error_message = f"HTML template not found at {template_path}"
+        print(f"Error: {error_message}")
+        return False, error_message
+
+    with build_timing.phase('template-render'):
+        with open(template_path, 'r') as f:
+            html_content = f.read()
+
+        # Update the script src in the HTML to point to the correct JS file
+        html_content = html_content.replace('src="{{pattern_name}}.js"', f'src="{pattern_name}.js"')
+
+        # Update the script block to use the correct pattern name
+        html_content = html_content.replace('window["{{pattern_name}}"]', f'window["{pattern_name}"]')
+
+    # Write the HTML file to pattern-specific directory
+    html_file = pattern_output_dir / "index.html"
+
+    try:
+        with open(html_file, 'w') as f:
+            f.write(html_content)
+    except Exception as e:
+        print(f"Error writing HTML file: {str(e)}")
+        return False, f"Error writing HTML file: {e}"
+
+    # Copy FX(hash) files to pattern-specific directory
+    if not copy_js_files(pattern_output_dir):
+        return False, "Could not copy FX(hash) files"
+
+    print(f"\nPattern compiled successfully!")
+    print(f"Output files created in: {pattern_output_dir}/")
+    print(f"To view the pattern, run: cd {pattern_output_dir} && python3 -m http.server")
+    return True, None
+
+def make_workspace(pattern_name):
+    """Create a private scratch directory for one compile.
+
+    Every compile gets its own source, compiler output and JS directories
+    under target/builds/, so any number of them can run at the same time."""
+    ensure_dir(WORKSPACE_ROOT)
+    workspace = Path(tempfile.mkdtemp(prefix=f"{pattern_name}-", dir=WORKSPACE_ROOT))
+    (workspace / "src").mkdir()
+    (workspace / "js").mkdir()
+    return workspace
+
+def workspace_build_args(workspace):
+    return ["--source-dir", str(workspace / "src"),
+            "--js-dir", str(workspace / "js"),
+            "--output-dir", str(workspace / "out")]
+
+def publish_pattern_js(workspace, pattern_name):
+    """Move a compiled bundle from its workspace into NFTmaker/dist/patterns/<name>/"""
+    built_js = workspace / "js" / f"{pattern_name}.js"
+    if not built_js.exists():
+        return False
     pattern_output_dir = Path(f"NFTmaker/dist/patterns/{pattern_name}")
     pattern_output_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Get the source and destination paths
+    # Same filesystem, so the new bundle replaces the old one in one step
+    with build_timing.phase('file-copy'):
+        os.replace(built_js, pattern_output_dir / f"{pattern_name}.js")
+    return True
+
+def compile_pattern(pattern_file, pattern_name, clean=False):
+    """Compile a pattern file into a standalone JS bundle"""
+    with build_timing.item('pattern', pattern_name):
+        return _compile_pattern(pattern_file, pattern_name, clean)
+
+def _compile_pattern_in_worker(pattern_file, pattern_name):
+    """compile_pattern for a pool worker process, returning its timings along with the result"""
+    worker_timer = build_timing.start('nft-worker')
+    result = compile_pattern(pattern_file, pattern_name)
+    return result, worker_timer.spans, worker_timer.items
+
+def _compile_pattern(pattern_file, pattern_name, clean):
+    # Ensure directories exist
+    ensure_dirs()
+    if clean:
+        clean_library_build()
+
+    # Get the source path
     source_path = Path(pattern_file)
     if not source_path.suffix:
         source_path = source_path.with_suffix('.cljs')
-    
-    dest_path = pattern_dir / f"{pattern_name}.cljs"
-    
-    # Only copy if the file is not already in the patterns directory
-    if source_path.parent != pattern_dir:
-        shutil.copy2(source_path, dest_path)
-        should_cleanup = True
-    else:
-        should_cleanup = False
-    
+
+    workspace = make_workspace(pattern_name)
     try:
-        # Set up environment with pattern name
-        env = os.environ.copy()
-        env["PATTERN_NAME"] = pattern_name
-        
-        # Run lein cljsbuild
-        try:
-            # First clean any previous builds
-            subprocess.run(["lein", "clean"], check=True, env=env)
-            
-            # Run the pattern build
-            pattern_result = subprocess.run(["lein", "cljsbuild", "once", "pattern"], 
-                                  check=True,
-                                  capture_output=True,
-                                  text=True,
-                                  env=env)
-            
-            # If compilation succeeded, copy the JS file to pattern-specific directory
-            js_file = pattern_output_dir / f"{pattern_name}.js"
-            
-            if js_file.exists():
-                # Read the HTML template
-                template_path = Path(os.path.dirname(os.path.abspath(__file__))) / "pattern_template.html"
-                
-                if not template_path.exists():
-                    print(f"Error: HTML template not found at {template_path}")
-                    return False
-                
-                with open(template_path, 'r') as f:
-                    html_content = f.read()
-                
-                # Update the script src in the HTML to point to the correct JS file
-                html_content = html_content.replace('src="{{pattern_name}}.js"', f'src="{pattern_name}.js"')
-                
-                # Update the script block to use the correct pattern name
-                html_content = html_content.replace('window["{{pattern_name}}"]', f'window["{pattern_name}"]')
-                
-                # Write the HTML file to pattern-specific directory
-                html_file = pattern_output_dir / "index.html"
-                
-                try:
-                    with open(html_file, 'w') as f:
-                        f.write(html_content)
-                except Exception as e:
-                    print(f"Error writing HTML file: {str(e)}")
-                    return False
-                
-                # Copy FX(hash) files to pattern-specific directory
-                if not copy_js_files(pattern_output_dir):
-                    return False
-                
-                # Clean up build directory
-                build_dir = pattern_output_dir / "build"
-                if build_dir.exists():
-                    shutil.rmtree(build_dir)
-                
-                print(f"\nPattern compiled successfully!")
-                print(f"Output files created in: {pattern_output_dir}/")
-                print(f"To view the pattern, run: cd {pattern_output_dir} && python3 -m http.server")
-                success = True
+        with build_timing.phase('file-copy'):
+            shutil.copy2(source_path, workspace / "src" / f"{pattern_name}.cljs")
+        # The workspace is seeded from the library cache in target/, so only
+        # the pattern namespace itself gets compiled here
+        success, error_message = run_pattern_build(workspace_build_args(workspace) + [pattern_name])
+        if success:
+            if publish_pattern_js(workspace, pattern_name):
+                success, error_message = package_pattern(pattern_name)
             else:
-                error_message = f"Compiled JS file not found at {js_file}"
-                print(f"Error: {error_message}")
-            
-        except subprocess.CalledProcessError as e:
-            error_message = f"Compilation failed: {e.stderr}"
-            print(f"Error compiling pattern:")
-            print(e.stdout)
-            print(e.stderr)
-            
+                success, error_message = False, f"Compiled JS file not found in {workspace / 'js'}"
     finally:
-        # Clean up pattern file only if we copied it
-        if should_cleanup and dest_path.exists():
-            dest_path.unlink()
-    
+        shutil.rmtree(workspace, ignore_errors=True)
+
     return success, error_message
 
+def compile_all_patterns(clean=False, jobs=1):
+    """Compile every pattern in NFTmaker/patterns.
+
+    With one job they are all compiled in a single compiler session. With
+    more, a process pool compiles them in separate workspaces.
+    Returns a dict of pattern name to (success, error_message)."""
+    ensure_dirs()
+    if clean:
+        clean_library_build()
+    pattern_files = sorted(Path("NFTmaker/patterns").glob("*.cljs"))
+    if not pattern_files:
+        print("No patterns found in NFTmaker/patterns")
+        return {}
+
+    # Build the shared library cache (and let lein AOT compile) once, before
+    # anything runs in parallel, so the workers only ever read it
+    if not LIBRARY_BUILD_DIR.exists():
+        success, error_message = precompile_library()
+        if not success:
+            return {p.stem: (False, error_message) for p in pattern_files}
+
+    if jobs > 1:
+        results = {}
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {p.stem: pool.submit(_compile_pattern_in_worker, str(p), p.stem) for p in pattern_files}
+            for name, future in futures.items():
+                results[name], spans, items = future.result()
+                build_timing.timer.merge(spans, items)
+        return results
+
+    workspace = make_workspace("all")
+    try:
+        for p in pattern_files:
+            shutil.copy2(p, workspace / "src" / p.name)
+        # One JVM compiles them all; a failing pattern doesn't stop the others,
+        # so each one is judged by whether its bundle was written
+        _, build_error = run_pattern_build(workspace_build_args(workspace) + [p.stem for p in pattern_files])
+        results = {}
+        for p in pattern_files:
+            if publish_pattern_js(workspace, p.stem):
+                results[p.stem] = package_pattern(p.stem)
+            else:
+                results[p.stem] = (False, build_error)
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+    return results
+
+def finish_timings(args):
+    if args.timings is not None:
+        build_timing.finish(args.timings)
+
 def main():
     parser = argparse.ArgumentParser(description="Compile a Patterning pattern into a standalone JS bundle")
-    parser.add_argument("pattern_file", help="Path to the pattern file")
+    parser.add_argument("pattern_file", nargs="?", help="Path to the pattern file")
     parser.add_argument("--name", help="Name for the pattern (defaults to filename without extension)")
-    
+    parser.add_argument("--all", action="store_true",
+                        help="Compile every pattern in NFTmaker/patterns in one compiler session")
+    parser.add_argument("--precompile", action="store_true",
+                        help="Only (re)compile the cached Patterning library in target/")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="With --all, compile this many patterns at once in separate processes")
+    parser.add_argument("--clean", action="store_true",
+                        help="Discard the cached library build first")
+
+    build_timing.add_arguments(parser)
+
     args = parser.parse_args()
-    
+    build_timing.start('nft')
+
+    if args.precompile:
+        success, error_message = precompile_library(args.clean)
+        if not success:
+            print(f"❌ Library failed to compile: {error_message}")
+        finish_timings(args)
+        sys.exit(0 if success else 1)
+
+    if args.all:
+        results = compile_all_patterns(args.clean, args.jobs)
+        failed = [name for name, (ok, _) in results.items() if not ok]
+        for name, (ok, error_message) in results.items():
+            print(f"✅ Pattern '{name}' compiled successfully!" if ok
+                  else f"❌ Pattern '{name}' failed to compile: {error_message}")
+        finish_timings(args)
+        sys.exit(1 if failed or not results else 0)
+
+    if not args.pattern_file:
+        parser.error("a pattern file is required unless --all or --precompile is given")
+
     # Get pattern name from filename if not provided
     pattern_name = args.name or Path(args.pattern_file).stem
-    
-    success, error_message = compile_pattern(args.pattern_file, pattern_name)
-    
+
+    if args.clean:
+        clean_library_build()
+    success, error_message = True, None
+    if not LIBRARY_BUILD_DIR.exists():
+        success, error_message = precompile_library()
+    if success:
+        success, error_message = compile_pattern(args.pattern_file, pattern_name)
+
     if success:
         print(f"✅ Pattern '{pattern_name}' compiled successfully!")
     else:
         print(f"❌ Pattern '{pattern_name}' failed to compile: {error_message}")
-    
+
+    finish_timings(args)
     sys.exit(0 if success else 1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
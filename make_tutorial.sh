@@ -6,27 +6,19 @@ TUTORIAL_ROOT="http://localhost:8000"
 # Create tutorial output directory if it doesn't exist
 mkdir -p tutorial/out
 
-# Copy workbench to tutorial output directory
-echo "Copying workbench to tutorial output directory..."
-cp -r workbench tutorial/out/
-
 # Copy shared tutorial stylesheet
 cp tutorial/tutorial.css tutorial/out/tutorial.css
 
 # This is my Virtual Env ... you might have a different one or none at all
 source ~/.main_python_venv/bin/activate
 
-# Process each markdown file in the tutorial sources directory
-for md_file in tutorial/sources/*.md; do
-    # Skip if no markdown files found
-    [ -e "$md_file" ] || { echo "No markdown files found in tutorial/sources directory"; exit 1; }
-    
-    # Get the base name without extension
-    base_name=$(basename "$md_file" .md)
-    
-    # Generate the HTML file directly in tutorial/out directory
-    echo "Processing $md_file..."
-    python3 tutorial/generate_pattern_page.py "$md_file" "tutorial/out/${base_name}.html" "$TUTORIAL_ROOT"
-done
+# Build every markdown file in the tutorial sources directory in one run.
+# Pattern blocks from all pages are rendered in parallel (one warm render
+# server per worker); pass eg. JOBS=8 to limit the number of workers.
+# Only pages and patterns that changed since the last build are redone, and
+# only changed workbench files are copied; pass FORCE=1 to rebuild everything.
+ls tutorial/sources/*.md > /dev/null 2>&1 || { echo "No markdown files found in tutorial/sources directory"; exit 1; }
+python3 tutorial/build_tutorial.py tutorial/sources tutorial/out "$TUTORIAL_ROOT" --sync workbench \
+    ${JOBS:+--jobs "$JOBS"} ${FORCE:+--force}
 
 echo "Tutorial build complete!" 
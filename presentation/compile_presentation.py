@@ -2,89 +2,149 @@
 
 import os
 import sys
-import subprocess
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import markdown
 import re
 from bs4 import BeautifulSoup
 import argparse
 
+import compile_slide
+import build_timing
+
 def convert_markdown_to_reveal(markdown_content):
     """Convert markdown content to Reveal.js HTML"""
-    html = markdown.markdown(markdown_content)
+    with build_timing.phase('markdown-to-html'):
+        html = markdown.markdown(markdown_content)
     return f'<section>{html}</section>'
 
-def generate_pattern_slide(pattern_name, no_compile=False):
-    """Generate a pattern slide using compile_slide.py"""
+CACHE_FILE = "slides/.slide-cache.json"
+
+def load_slide_cache():
+    """Source hash and library fingerprint of each slide's last successful build"""
+    try:
+        with open(CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_slide_cache(cache):
+    tmp_file = CACHE_FILE + ".tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, CACHE_FILE)
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def pattern_file_for(pattern_name):
     # Always use patterns/ subdir for pattern files
-    print("In generate_pattern_slide")
     if not pattern_name.startswith("patterns/"):
-        pattern_file = f"patterns/{pattern_name}"
-    else:
-        pattern_file = pattern_name
+        return f"patterns/{pattern_name}"
+    return pattern_name
+
+def generate_pattern_slide(pattern_name, no_compile=False, cache=None, fingerprint=None, template_hash=None):
+    """Generate a pattern slide with compile_slide, skipping it if nothing changed.
+
+    Returns (slide name, cache entry) or (None, None) on failure."""
+    with build_timing.item('slide', pattern_name):
+        return _generate_pattern_slide(pattern_name, no_compile, cache, fingerprint, template_hash)
+
+def _generate_pattern_slide(pattern_name, no_compile, cache, fingerprint, template_hash):
+    pattern_file = pattern_file_for(pattern_name)
     if not os.path.exists(pattern_file):
         print(f"Error: Pattern file not found: {pattern_file}")
-        return None
-    print("About to run compile_slide on %s" % pattern_file)
-    cmd = [sys.executable, "compile_slide.py", pattern_file]
+        return None, None
+    stem = Path(pattern_file).stem
+    slides_dir = Path("slides")
+
     if no_compile:
-        cmd.append("--no-compile")
-    result = subprocess.run(
-        cmd,
-        capture_output=True,
-        text=True
+        if not compile_slide.write_slide_html(stem, pattern_file, slides_dir):
+            return None, None
+        return stem, (cache or {}).get(stem)
+
+    entry = {'source': file_hash(pattern_file), 'library': fingerprint, 'template': template_hash}
+    outputs = [slides_dir / f"{stem}.js", slides_dir / f"{stem}.html"]
+    if cache is not None and cache.get(stem) == entry and all(p.exists() for p in outputs):
+        print(f"Up to date: {stem}")
+        return stem, entry
+
+    print("About to compile slide %s" % pattern_file)
+    if not compile_slide.compile_pattern(pattern_file, stem):
+        print(f"Error compiling pattern {pattern_name}")
+        return None, None
+    return stem, entry
+
+def pattern_slide_html(pattern_slide):
+    return (
+        f'<section data-background-iframe="{pattern_slide}.html" data-background-interactive>'
+        f'<a href="{pattern_slide}.html" target="_blank" '
+        f'style="position:absolute;top:10px;right:20px;z-index:10;font-size:1.2em;">➡️</a>'
+        f'</section>'
     )
-    print(result.stdout)
-    print(result.stderr)
-    if result.returncode != 0:
-        print(f"Error compiling pattern {pattern_name}:")
-        print(result.stderr)
-        return None
-    return Path(pattern_file).stem
-
-def process_markdown_presentation(md_file, no_compile=False):
-    print("In process_markdown_presentation")
+
+def process_markdown_presentation(md_file, no_compile=False, jobs=None, force=False):
     # No need to create extra directories, just ensure slides/ exists
     os.makedirs("slides", exist_ok=True)
     with open(md_file, 'r') as f:
         content = f.read()
-    sections = content.split('----')
+    with build_timing.phase('markdown-split'):
+        sections = [section.strip() for section in content.split('----')]
+        sections = [section for section in sections if section]
+
+    cache = {} if force else load_slide_cache()
+    fingerprint = None if no_compile else compile_slide.library_fingerprint()
+    template_hash = file_hash("slide_template.html")
+    if not no_compile and not compile_slide.library_is_compiled():
+        # Built once up front, so the parallel slide builds only read it
+        if not compile_slide.precompile_library():
+            sys.exit(1)
+
+    # Pattern slides compile concurrently; each compile runs in its own
+    # workspace, and the deck is assembled in the original order afterwards
+    pattern_names = [section.split(':PATTERN')[1].strip() for section in sections if ':PATTERN' in section]
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+        futures = {name: pool.submit(generate_pattern_slide, name, no_compile, cache, fingerprint, template_hash)
+                   for name in dict.fromkeys(pattern_names)}
+        results = {name: future.result() for name, future in futures.items()}
+
+    new_cache = dict(cache)
+    for pattern_slide, entry in results.values():
+        if pattern_slide and entry:
+            new_cache[pattern_slide] = entry
+    save_slide_cache(new_cache)
+
     slides = []
     for section in sections:
-        section = section.strip()
-        print(f"Processing section: {section[:40]}")
-        if not section:
-            continue
         if ':PATTERN' in section:
-            print("Found a PATTERN section!")
-            pattern_name = section.strip().split(':PATTERN')[1].strip()
-            pattern_slide = generate_pattern_slide(pattern_name, no_compile=no_compile)
+            pattern_slide, _ = results[section.split(':PATTERN')[1].strip()]
             if pattern_slide:
-                iframe_slide = (
-                    f'<section data-background-iframe="{pattern_slide}.html" data-background-interactive>'
-                    f'<a href="{pattern_slide}.html" target="_blank" '
-                    f'style="position:absolute;top:10px;right:20px;z-index:10;font-size:1.2em;">➡️</a>'
-                    f'</section>'
-                )
-                slides.append(iframe_slide)
+                slides.append(pattern_slide_html(pattern_slide))
         else:
-            slide = convert_markdown_to_reveal(section)
-            slides.append(slide)
+            slides.append(convert_markdown_to_reveal(section))
     generate_final_presentation(slides)
+    failed = [name for name, (pattern_slide, _) in results.items() if not pattern_slide]
+    return not failed
 
 def generate_final_presentation(slides):
     template_path = Path("slide_template.html")
-    with open(template_path, 'r') as f:
-        template = f.read()
-    soup = BeautifulSoup(template, 'html.parser')
-    slides_div = soup.find('div', class_='slides')
-    slides_div.clear()
-    for slide in slides:
-        slide_soup = BeautifulSoup(slide, 'html.parser')
-        slides_div.append(slide_soup)
+    with build_timing.phase('template-render'):
+        with open(template_path, 'r') as f:
+            template = f.read()
+        soup = BeautifulSoup(template, 'html.parser')
+        slides_div = soup.find('div', class_='slides')
+        slides_div.clear()
+        for slide in slides:
+            slide_soup = BeautifulSoup(slide, 'html.parser')
+            slides_div.append(slide_soup)
+        html = str(soup)
     output_file = "slides/presentation.html"
-    with open(output_file, 'w') as f:
-        f.write(str(soup))
+    with build_timing.phase('html-write'):
+        with open(output_file, 'w') as f:
+            f.write(html)
     print(f"Presentation generated: {output_file}")
 
 def main():
@@ -92,11 +152,20 @@ def main():
     parser = argparse.ArgumentParser(description="Compile a Patterning markdown presentation into Reveal.js slides")
     parser.add_argument("markdown_file", help="Path to the markdown file")
     parser.add_argument("--no-compile", action="store_true", help="Skip ClojureScript compilation step for all patterns")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of slides to compile at once (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Recompile every slide, even unchanged ones")
+    build_timing.add_arguments(parser)
     args = parser.parse_args()
     if not os.path.exists(args.markdown_file):
         print(f"Error: Markdown file not found: {args.markdown_file}")
         sys.exit(1)
-    process_markdown_presentation(args.markdown_file, no_compile=args.no_compile)
+    build_timing.start('presentation')
+    ok = process_markdown_presentation(args.markdown_file, no_compile=args.no_compile,
+                                       jobs=args.jobs, force=args.force)
+    if args.timings is not None:
+        build_timing.finish(args.timings)
+    if not ok:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
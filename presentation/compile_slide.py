@@ -1,17 +1,23 @@
 #!/usr/bin/env python3
 
-print(">>> compile_slide.py started", flush=True)
-
 import os
 import sys
 import shutil
 import subprocess
 import argparse
+import tempfile
 from pathlib import Path
 import re
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import build_timing
+from source_fingerprint import source_fingerprint
+
 # Determine the project root (one directory up from this script)
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BUILD_SCRIPT = "NFTmaker/scripts/build_patterns.clj"
+LIBRARY_BUILD_DIR = os.path.join(PROJECT_ROOT, "target/slide-library")
+WORKSPACE_ROOT = os.path.join(PROJECT_ROOT, "target/builds")
 
 def ensure_dirs():
     """Ensure required directories exist"""
@@ -28,7 +34,12 @@ def copy_main_js():
     target_dir = Path("slides")
     
     try:
-        shutil.copy2(main_js, target_dir / "main.js")
+        # Copy under a private name first; slides compiling in parallel may
+        # all be copying main.js at once
+        tmp_file = target_dir / f"main.js.{os.getpid()}.tmp"
+        with build_timing.phase('file-copy'):
+            shutil.copy2(main_js, tmp_file)
+            os.replace(tmp_file, target_dir / "main.js")
         return True
     except Exception as e:
         print(f"Error copying main.js: {str(e)}")
@@ -72,155 +83,146 @@ def extract_metadata(pattern_file):
     
     return metadata, code
 
+def run_slide_build(args):
+    """Run the shared pattern build script for slides. Returns True on success."""
+    try:
+        # Includes starting the JVM
+        with build_timing.phase('cljs-compile'):
+            result = subprocess.run(["lein", "run", "-m", "clojure.main", BUILD_SCRIPT, "--build", "slide"] + list(args),
+                                    capture_output=True,
+                                    text=True,
+                                    cwd=PROJECT_ROOT)
+    except FileNotFoundError as e:
+        print(f"Error: could not run lein: {e}")
+        return False
+    print(result.stdout, end='')
+    if result.returncode != 0:
+        print(f"Error compiling pattern:")
+        print(result.stderr)
+        return False
+    return True
+
+def precompile_library():
+    """Compile the Patterning library once into target/ for later slide builds.
+
+    Run this before compiling slides in parallel; the parallel builds then
+    only ever read the cache."""
+    return run_slide_build(["--library"])
+
+def library_is_compiled():
+    return os.path.isdir(LIBRARY_BUILD_DIR)
+
+def library_fingerprint():
+    """Hash of everything outside the slide's own source that goes into its JS:
+    the library sources and the build script, paths included."""
+    return source_fingerprint([os.path.join(PROJECT_ROOT, path) for path in ("src/cljc", "src/cljs", BUILD_SCRIPT)],
+                              PROJECT_ROOT)
+
+def make_workspace(pattern_name):
+    """Create a private scratch directory for one slide compile under target/builds/"""
+    os.makedirs(WORKSPACE_ROOT, exist_ok=True)
+    workspace = Path(tempfile.mkdtemp(prefix=f"slide-{pattern_name}-", dir=WORKSPACE_ROOT))
+    (workspace / "src").mkdir()
+    (workspace / "js").mkdir()
+    return workspace
+
+def write_slide_html(pattern_name, pattern_file, slides_dir):
+    """Write slides/<name>.html from the slide template. Returns True on success."""
+    with build_timing.phase('template-render'):
+        return _write_slide_html(pattern_name, pattern_file, slides_dir)
+
+def _write_slide_html(pattern_name, pattern_file, slides_dir):
+    # Extract metadata from pattern file
+    metadata, source_code = extract_metadata(pattern_file)
+    
+    # Read the slide template
+    template_path = Path(__file__).parent / "slide_template.html"
+    
+    if not template_path.exists():
+        print(f"Error: Slide template not found at {template_path}")
+        return False
+    
+    with open(template_path, 'r') as f:
+        html_content = f.read()
+    
+    # Update the template with metadata and file paths
+    html_content = html_content.replace('{{title}}', metadata['title'])
+    html_content = html_content.replace('{{description}}', metadata['description'])
+    html_content = html_content.replace('{{pattern_name}}', pattern_name)
+    html_content = html_content.replace('{{source_code}}', source_code)
+    
+    # Write the HTML file to slides directory
+    html_file = slides_dir / f"{pattern_name}.html"
+    
+    try:
+        with open(html_file, 'w') as f:
+            f.write(html_content)
+    except Exception as e:
+        print(f"Error writing HTML file: {str(e)}")
+        return False
+    return True
+
 def compile_pattern(pattern_file, pattern_name):
-    """Compile a pattern file into a slide"""
+    """Compile a pattern file into a slide.
+
+    Each compile works in its own workspace, so several can run at once.
+    Only the finished files are moved into slides/."""
     # Ensure directories exist
     ensure_dirs()
+    slides_dir = Path("slides")
     
-    # Create pattern directory if it doesn't exist
-    pattern_dir = Path("patterns")
-    pattern_dir.mkdir(exist_ok=True)
-    
-    # Get the source and destination paths
+    # Get the source path
     source_path = Path(pattern_file)
     if not source_path.suffix:
         source_path = source_path.with_suffix('.cljs')
     
-    dest_path = pattern_dir / f"{pattern_name}.cljs"
-    
-    # Only copy if the file is not already in the patterns directory
-    if source_path.parent != pattern_dir:
-        shutil.copy2(source_path, dest_path)
-        should_cleanup = True
-    else:
-        should_cleanup = False
-    
+    workspace = make_workspace(pattern_name)
     try:
-        # Set up environment with pattern name
-        env = os.environ.copy()
-        env["PATTERN_NAME"] = pattern_name
+        with build_timing.phase('file-copy'):
+            shutil.copy2(source_path, workspace / "src" / f"{pattern_name}.cljs")
+        if not run_slide_build(["--source-dir", str(workspace / "src"),
+                                "--js-dir", str(workspace / "js"),
+                                "--output-dir", str(workspace / "out"),
+                                pattern_name]):
+            return False
         
-        # Run lein cljsbuild
-        try:
-            # First clean any previous builds
-            subprocess.run(["lein", "clean"], check=True, env=env, cwd=PROJECT_ROOT)
-            
-            # Create a temporary project.clj with pattern name substituted
-            with open(os.path.join(PROJECT_ROOT, "project.clj"), "r") as f:
-                project_content = f.read()
-            
-            # Substitute pattern name in project.clj
-            project_content = project_content.replace("{{pattern_name}}", pattern_name)
-            
-            with open(os.path.join(PROJECT_ROOT, "project.clj.tmp"), "w") as f:
-                f.write(project_content)
-            
-            try:
-                # Run the pattern build with the temporary project.clj
-                pattern_result = subprocess.run([
-                    "lein", "with-profile", "+dev", "cljsbuild", "once", "presentation-pattern"
-                ],
-                check=True,
-                capture_output=True,
-                text=True,
-                env=env,
-                cwd=PROJECT_ROOT)
-                
-                # Move the generated files to their correct locations
-                slides_dir = Path("slides")
-                temp_js = slides_dir / "{{pattern_name}}.js"
-                temp_map = slides_dir / "{{pattern_name}}.js.map"
-                
-                if temp_js.exists():
-                    # Fix source map URL in JS file
-                    with open(temp_js, 'r') as f:
-                        js_content = f.read()
-                    js_content = js_content.replace("{{pattern_name}}.js.map", f"{pattern_name}.js.map")
-                    with open(temp_js, 'w') as f:
-                        f.write(js_content)
-                    
-                    # Move JS file
-                    shutil.move(temp_js, slides_dir / f"{pattern_name}.js")
-                    # Move source map
-                    if temp_map.exists():
-                        shutil.move(temp_map, slides_dir / f"{pattern_name}.js.map")
-                
-                # If compilation succeeded, create the slide HTML
-                js_file = slides_dir / f"{pattern_name}.js"
-                
-                if js_file.exists():
-                    # Copy main.js if it doesn't exist
-                    if not (slides_dir / "main.js").exists():
-                        if not copy_main_js():
-                            return False
-                    
-                    # Extract metadata from pattern file
-                    metadata, source_code = extract_metadata(dest_path)
-                    
-                    # Read the slide template
-                    template_path = Path(__file__).parent / "slide_template.html"
-                    
-                    if not template_path.exists():
-                        print(f"Error: Slide template not found at {template_path}")
-                        return False
-                    
-                    with open(template_path, 'r') as f:
-                        html_content = f.read()
-                    
-                    # Update the template with metadata and file paths
-                    html_content = html_content.replace('{{title}}', metadata['title'])
-                    html_content = html_content.replace('{{description}}', metadata['description'])
-                    html_content = html_content.replace('{{pattern_name}}', pattern_name)
-                    html_content = html_content.replace('{{source_code}}', source_code)
-                    
-                    # Write the HTML file to slides directory
-                    html_file = slides_dir / f"{pattern_name}.html"
-                    
-                    try:
-                        with open(html_file, 'w') as f:
-                            f.write(html_content)
-                    except Exception as e:
-                        print(f"Error writing HTML file: {str(e)}")
-                        return False
-                    
-                    print(f"\nSlide compiled successfully!")
-                    print(f"Output files created in: slides/")
-                    return True
-                else:
-                    print(f"Error: Compiled JS file not found at {js_file}")
-                    return False
-                
-            finally:
-                # Clean up temporary project.clj
-                if os.path.exists(os.path.join(PROJECT_ROOT, "project.clj.tmp")):
-                    os.remove(os.path.join(PROJECT_ROOT, "project.clj.tmp"))
-                
-        except subprocess.CalledProcessError as e:
-            print(f"Error compiling pattern:")
-            print(e.stdout)
-            print(e.stderr)
-            sys.exit(1)
-            
+        built_js = workspace / "js" / f"{pattern_name}.js"
+        if not built_js.exists():
+            print(f"Error: Compiled JS file not found at {built_js}")
+            return False
+        
+        # Copy main.js if it doesn't exist
+        if not (slides_dir / "main.js").exists():
+            if not copy_main_js():
+                return False
+        
+        # Move the generated files into slides/; the source map sits next to
+        # the JS and is referenced by file name, so the pair moves together
+        built_map = workspace / "js" / f"{pattern_name}.js.map"
+        with build_timing.phase('file-copy'):
+            if built_map.exists():
+                os.replace(built_map, slides_dir / f"{pattern_name}.js.map")
+            os.replace(built_js, slides_dir / f"{pattern_name}.js")
+        
+        if not write_slide_html(pattern_name, source_path, slides_dir):
+            return False
+        
+        print(f"\nSlide compiled successfully!")
+        print(f"Output files created in: slides/")
+        return True
     finally:
-        # Clean up pattern file only if we copied it
-        if should_cleanup and dest_path.exists():
-            dest_path.unlink()
-
-def main():
-    parser = argparse.ArgumentParser(description="Compile a Patterning pattern into a presentation slide")
-    parser.add_argument("pattern_file", help="Path to the pattern file")
-    parser.add_argument("--name", help="Name for the pattern (defaults to filename without extension)")
-    parser.add_argument("--no-compile", action="store_true", help="Skip ClojureScript compilation step")
-    args = parser.parse_args()
-
-    pattern_name = args.name or Path(args.pattern_file).stem
+        shutil.rmtree(workspace, ignore_errors=True)
 
+def build_slide(args, pattern_name):
+    """Compile (or just regenerate the HTML of) one slide. Returns an exit status."""
     # Copy main.js
     if not copy_main_js():
         return 1
 
     # Compile the pattern unless --no-compile is set
     if not args.no_compile:
+        if not library_is_compiled() and not precompile_library():
+            return 1
         success = compile_pattern(args.pattern_file, pattern_name)
         if not success:
             return 1
@@ -230,22 +232,28 @@ def main():
         dest_path = Path("patterns") / f"{pattern_name}.cljs"
         if not dest_path.exists():
             dest_path = Path(args.pattern_file)
-        template_path = Path(__file__).parent / "slide_template.html"
-        if not template_path.exists():
-            print(f"Error: Slide template not found at {template_path}")
+        if not write_slide_html(pattern_name, dest_path, slides_dir):
             return 1
-        with open(template_path, 'r') as f:
-            html_content = f.read()
-        metadata, source_code = extract_metadata(dest_path)
-        html_content = html_content.replace('{{title}}', metadata['title'])
-        html_content = html_content.replace('{{description}}', metadata['description'])
-        html_content = html_content.replace('{{pattern_name}}', pattern_name)
-        html_content = html_content.replace('{{source_code}}', source_code)
         html_file = slides_dir / f"{pattern_name}.html"
-        with open(html_file, 'w') as f:
-            f.write(html_content)
         print(f"Slide HTML regenerated (no ClojureScript compile): {html_file}")
     return 0
 
+def main():
+    parser = argparse.ArgumentParser(description="Compile a Patterning pattern into a presentation slide")
+    parser.add_argument("pattern_file", help="Path to the pattern file")
+    parser.add_argument("--name", help="Name for the pattern (defaults to filename without extension)")
+    parser.add_argument("--no-compile", action="store_true", help="Skip ClojureScript compilation step")
+    build_timing.add_arguments(parser)
+    args = parser.parse_args()
+    build_timing.start('slide')
+
+    pattern_name = args.name or Path(args.pattern_file).stem
+    with build_timing.item('slide', pattern_name):
+        status = build_slide(args, pattern_name)
+    if args.timings is not None:
+        build_timing.finish(args.timings)
+    return status
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    print(">>> compile_slide.py started", flush=True)
+    sys.exit(main()) 
\ No newline at end of file
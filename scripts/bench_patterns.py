@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+"""Render benchmark for the Patterning library.
+
+The corpus is every pattern block in the tutorial sources (split out exactly
+as the tutorial build does) plus the NFTmaker patterns. `patterning.bench`
+times each one in a single warm JVM: SCI eval, realizing the lazy result,
+schema validation and SVG writing, separately, over several repetitions.
+
+The results are written as JSON and compared with a saved baseline. A pattern
+regresses when the median of a stage grows by more than --threshold (a
+fraction) and by more than --min-ms, or when it stops rendering. Any
+regression makes the script exit with status 1.
+
+Run from the project root:
+
+    python3 scripts/bench_patterns.py                     # run and compare
+    python3 scripts/bench_patterns.py --save-baseline     # run and save as the baseline
+    python3 scripts/bench_patterns.py --only nft/ --reps 20
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tutorial'))
+import generate_pattern_page as gpp
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TUTORIAL_SOURCES = os.path.join(PROJECT_ROOT, 'tutorial', 'sources')
+NFT_PATTERNS = os.path.join(PROJECT_ROOT, 'NFTmaker', 'patterns')
+BENCH_DIR = os.path.join(PROJECT_ROOT, 'target', 'bench')
+DEFAULT_BASELINE = os.path.join(PROJECT_ROOT, 'bench-baseline.json')
+STAGES = ('eval', 'realize', 'validate', 'svg', 'total')
+
+# Library namespaces as they are named in the SCI render context (see
+# patterning.dynamic/get-patterning-namespaces)
+SCI_NAMESPACES = {
+    'patterning.groups': 'p-groups',
+    'patterning.layouts': 'p-layouts',
+    'patterning.sshapes': 'p-sshapes',
+    'patterning.color': 'p-color',
+    'patterning.maths': 'p-maths',
+    'patterning.view': 'p-view',
+    'patterning.library.std': 'p-lib-std',
+    'patterning.library.turtle': 'p-lib-turtle',
+    'patterning.library.l_systems': 'p-lib-lsystems',
+    'patterning.library.complex_elements': 'p-lib-complex',
+    'patterning.library.complex-elements': 'p-lib-complex',
+    'patterning.library.machines': 'p-lib-machines',
+    'patterning.library.symbols': 'p-lib-symbols',
+    'patterning.library.douat': 'p-lib-douat',
+    'patterning.library.spiro': 'p-lib-spiro',
+}
+
+
+def tutorial_corpus(sources_dir=TUTORIAL_SOURCES):
+    """One entry per pattern block of every tutorial page, in page order."""
+    entries = []
+    for markdown_file in sorted(glob.glob(os.path.join(sources_dir, '*.md'))):
+        with open(markdown_file, 'r') as f:
+            content = f.read()
+        page = os.path.splitext(os.path.basename(markdown_file))[0]
+        _, _, cards = gpp.split_page_blocks(content)
+        for card in cards:
+            if card['kind'] == 'pattern':
+                width, height = card['size']
+                entries.append({'id': f"tutorial/{page}/{card['id']}",
+                                'code': card['code'], 'width': width, 'height': height})
+    return entries
+
+
+def nft_code(source):
+    """Make an NFTmaker pattern evaluable in the JVM render context.
+
+    The patterns are ClojureScript namespaces whose `main` takes JS params and
+    draws on a canvas. Replace the ns form with requires of the render
+    context's names for any aliased library namespaces (it already refers the
+    library functions), drop the JS conversions and console logging, and call
+    `main` without a canvas. Patterns that still need the browser (eg. the fxhash
+    random generator) are reported as errors by the benchmark and skipped in
+    comparisons."""
+    ns_form = re.search(r'^\(ns\s[\s\S]*?\)\)\s*$', source, flags=re.MULTILINE)
+    requires = []
+    if ns_form:
+        for lib, alias in re.findall(r'\[([\w.\-]+)[^\]]*?(?:\[[^\]]*\][^\]]*?)*:as\s+([\w\-]+)', ns_form.group(0)):
+            if lib in SCI_NAMESPACES:
+                requires.append(f"(require '[{SCI_NAMESPACES[lib]} :as {alias}])\n")
+    code = ''.join(requires) + source[ns_form.end():] if ns_form else source
+    code = re.sub(r'\(js->clj\s+(\w+)[^)]*\)', r'\1', code)
+    code = code.replace('(js/console.log', '(comment')
+    code = re.sub(r'\(when canvas[\s\S]*?\)\)\s*\n', '\n', code)
+    return code + '\n(main {})\n'
+
+
+def nft_corpus(patterns_dir=NFT_PATTERNS):
+    entries = []
+    for path in sorted(glob.glob(os.path.join(patterns_dir, '*.cljs'))):
+        with open(path, 'r') as f:
+            source = f.read()
+        name = os.path.splitext(os.path.basename(path))[0]
+        entries.append({'id': f'nft/{name}', 'code': nft_code(source), 'width': 800, 'height': 800})
+    return entries
+
+
+def build_corpus(only=None):
+    entries = tutorial_corpus() + nft_corpus()
+    if only:
+        entries = [entry for entry in entries if any(entry['id'].startswith(prefix) for prefix in only)]
+    return entries
+
+
+def run_benchmark(corpus, results_path, reps, warmup):
+    """Time the corpus in one JVM. Returns the parsed results, or None if the run failed."""
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    corpus_path = os.path.join(BENCH_DIR, 'corpus.json')
+    with open(corpus_path, 'w') as f:
+        json.dump(corpus, f, indent=1)
+    result = subprocess.run(['lein', 'run', '-m', 'patterning.bench', corpus_path, results_path,
+                             '--reps', str(reps), '--warmup', str(warmup)],
+                            cwd=PROJECT_ROOT)
+    if result.returncode != 0 or not os.path.exists(results_path):
+        print(f"Error: benchmark run failed (exit status {result.returncode})")
+        return None
+    with open(results_path, 'r') as f:
+        return json.load(f)
+
+
+def stage_median(entry, stage):
+    return entry.get('stages', {}).get(stage, {}).get('median')
+
+
+def compare(results, baseline, threshold, min_ms):
+    """List the regressions of results against baseline, as printable lines."""
+    old_by_id = {entry['id']: entry for entry in baseline.get('patterns', [])}
+    regressions = []
+    for entry in results['patterns']:
+        old = old_by_id.get(entry['id'])
+        if old is None or old.get('status') != 'ok':
+            continue
+        if entry.get('status') != 'ok':
+            regressions.append(f"{entry['id']}: now {entry.get('status')} {entry.get('error', '')}".rstrip())
+            continue
+        for stage in STAGES:
+            before, after = stage_median(old, stage), stage_median(entry, stage)
+            if before is None or after is None:
+                continue
+            if after > before * (1 + threshold) and after - before > min_ms:
+                regressions.append(f"{entry['id']}: {stage} {before:.2f}ms -> {after:.2f}ms "
+                                   f"(+{(after / before - 1) * 100 if before else float('inf'):.0f}%)")
+    return regressions
+
+
+def print_summary(results, baseline=None):
+    old_by_id = {entry['id']: entry for entry in (baseline or {}).get('patterns', [])}
+    print(f"\n{'pattern':<44}{'eval':>9}{'realize':>9}{'valid':>9}{'svg':>9}{'total':>10}{'vs base':>9}")
+    totals = {stage: 0.0 for stage in STAGES}
+    for entry in results['patterns']:
+        if entry.get('status') != 'ok':
+            print(f"{entry['id']:<44}  {entry.get('status')}: {entry.get('error', '')[:60]}")
+            continue
+        medians = [stage_median(entry, stage) for stage in STAGES]
+        for stage, ms in zip(STAGES, medians):
+            totals[stage] += ms
+        old_total = stage_median(old_by_id.get(entry['id'], {}), 'total')
+        change = f"{(medians[-1] / old_total - 1) * 100:+.0f}%" if old_total else ''
+        print(f"{entry['id']:<44}" + ''.join(f"{ms:>9.2f}" for ms in medians[:-1])
+              + f"{medians[-1]:>10.2f}{change:>9}")
+    print(f"{'TOTAL (ms, medians)':<44}" + ''.join(f"{totals[stage]:>9.2f}" for stage in STAGES[:-1])
+          + f"{totals['total']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pattern rendering over the tutorial and NFTmaker patterns')
+    parser.add_argument('--reps', type=int, default=5, help='Measured repetitions per pattern (default: 5)')
+    parser.add_argument('--warmup', type=int, default=2, help='Unmeasured runs per pattern first (default: 2)')
+    parser.add_argument('--only', action='append', metavar='PREFIX',
+                        help='Only benchmark patterns whose id starts with PREFIX, eg. nft/ or tutorial/Layouts/ (may be repeated)')
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results.json'), help='Where to write the results')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Save these results as the baseline instead of comparing')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Fractional slowdown of a stage that counts as a regression (default: 0.2)')
+    parser.add_argument('--min-ms', type=float, default=1.0,
+                        help='Ignore slowdowns smaller than this many ms, which are mostly noise (default: 1.0)')
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.only)
+    print(f"Benchmarking {len(corpus)} patterns")
+    results = run_benchmark(corpus, os.path.abspath(args.output), args.reps, args.warmup)
+    if results is None:
+        return 1
+
+    if args.save_baseline:
+        print_summary(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print_summary(results)
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    print_summary(results, baseline)
+    regressions = compare(results, baseline, args.threshold, args.min_ms)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold * 100:.0f}%:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\nNo regressions against the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""Timing for the Python build pipelines.
+
+The tutorial, NFT and presentation builders all time their phases through the
+module-level `timer`:
+
+    with build_timing.phase('markdown-to-html'):
+        ...
+
+    with build_timing.item('page', 'HelloWorld.html'):
+        ...
+
+Phases are the kinds of work (splitting markdown, spawning lein, JVM eval,
+writing SVGs, rendering templates, copying files); items are the things being
+built (pages, blocks, slides, patterns). A phase run inside an item is
+attributed to it. Times measured elsewhere, such as the eval and SVG timings
+the render server reports, are added with `record`.
+
+`finish` prints a summary of the phase totals and the slowest items, and
+writes the full report as JSON when given a path.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+REPORT_VERSION = 1
+
+
+class BuildTimer:
+    """Collects phase spans and item times for one build run. Thread safe."""
+
+    def __init__(self, pipeline=None):
+        self.pipeline = pipeline
+        self.started = time.time()
+        self._clock_start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.spans = []
+        self.items = []
+
+    def _item_stack(self):
+        if not hasattr(self._local, 'items'):
+            self._local.items = []
+        return self._local.items
+
+    def current_item(self):
+        stack = self._item_stack()
+        return stack[-1] if stack else None
+
+    def record(self, phase, seconds, item=None):
+        """Add a phase span whose time was measured elsewhere."""
+        if item is None:
+            item = self.current_item()
+        with self._lock:
+            self.spans.append({'phase': phase, 'item': item, 'seconds': seconds})
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    @contextmanager
+    def item(self, kind, name):
+        key = f'{kind}:{name}'
+        stack = self._item_stack()
+        stack.append(key)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stack.pop()
+            self.add_item(kind, name, time.perf_counter() - start)
+
+    def add_item(self, kind, name, seconds):
+        """Add an item whose time was measured elsewhere, eg. summed over several workers."""
+        with self._lock:
+            self.items.append({'kind': kind, 'name': name, 'seconds': seconds})
+
+    def merge(self, spans, items):
+        """Add spans and items collected by another timer, eg. in a worker process."""
+        with self._lock:
+            self.spans.extend(spans)
+            self.items.extend(items)
+
+    def phase_totals(self):
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            entry = totals.setdefault(span['phase'], {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            entry['count'] += 1
+            entry['seconds'] += span['seconds']
+            entry['max_seconds'] = max(entry['max_seconds'], span['seconds'])
+        return totals
+
+    def report(self):
+        with self._lock:
+            spans = list(self.spans)
+            items = list(self.items)
+        return {'version': REPORT_VERSION,
+                'pipeline': self.pipeline,
+                'started': self.started,
+                'wall_seconds': time.perf_counter() - self._clock_start,
+                'argv': sys.argv,
+                'phases': self.phase_totals(),
+                'items': items,
+                'spans': spans}
+
+    def write_report(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def summary(self, limit=10):
+        """Human readable phase totals and the slowest items of each kind."""
+        report = self.report()
+        lines = [f"Build timings ({report['pipeline'] or 'build'}, {report['wall_seconds']:.2f}s wall)",
+                 f"  {'phase':<24}{'count':>7}{'total':>10}{'max':>10}"]
+        phases = sorted(report['phases'].items(), key=lambda kv: -kv[1]['seconds'])
+        for name, entry in phases:
+            lines.append(f"  {name:<24}{entry['count']:>7}{entry['seconds']:>9.2f}s{entry['max_seconds']:>9.2f}s")
+        kinds = sorted({entry['kind'] for entry in report['items']})
+        for kind in kinds:
+            slowest = sorted((entry for entry in report['items'] if entry['kind'] == kind),
+                             key=lambda entry: -entry['seconds'])[:limit]
+            lines.append(f"Slowest {kind}s:")
+            for entry in slowest:
+                lines.append(f"  {entry['seconds']:>8.2f}s  {entry['name']}")
+        return '\n'.join(lines)
+
+
+timer = BuildTimer()
+
+
+def start(pipeline):
+    """Begin timing a new run of the named pipeline."""
+    global timer
+    timer = BuildTimer(pipeline)
+    return timer
+
+
+def phase(name):
+    return timer.phase(name)
+
+
+def item(kind, name):
+    return timer.item(kind, name)
+
+
+def add_item(kind, name, seconds):
+    timer.add_item(kind, name, seconds)
+
+
+def record(phase_name, seconds, item_key=None):
+    timer.record(phase_name, seconds, item_key)
+
+
+def record_jvm_timings(timings, item_key=None):
+    """Record the per-stage milliseconds reported by `patterning.cli` render jobs."""
+    for stage, millis in (timings or {}).items():
+        record(f'jvm-{stage}', millis / 1000.0, item_key)
+
+
+def finish(report_path=None, limit=10):
+    """Print the summary and, given a path, write the JSON report."""
+    print(timer.summary(limit))
+    if report_path:
+        timer.write_report(report_path)
+        print(f"Timing report written to {report_path}")
+
+
+def add_arguments(parser):
+    """Add the --timings option shared by the build scripts."""
+    parser.add_argument('--timings', nargs='?', const='', default=None, metavar='REPORT.json',
+                        help='Print a timing summary at the end, and write a JSON report if a path is given')
@@ -0,0 +1,34 @@
+"""Content hashes of source trees, shared by the Python build pipelines.
+
+The tutorial's SVG cache and the presentation's slide cache both key their
+entries on the Patterning library sources, so that editing the library
+rebuilds everything built from it:
+
+    source_fingerprint([LIBRARY_DIR], LIBRARY_DIR)
+"""
+
+import hashlib
+import os
+
+
+def source_files(paths):
+    """Every file under paths (directories or single files), in a stable order."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                yield os.path.join(root, name)
+
+
+def source_fingerprint(paths, root):
+    """Hash the contents of every file under paths, together with its path
+    relative to root, so moving a file changes the hash too."""
+    digest = hashlib.sha256()
+    for path in source_files(paths):
+        digest.update(os.path.relpath(path, root).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
@@ -0,0 +1,133 @@
+(ns patterning.bench
+  "Render benchmark over a corpus of patterns.
+
+   Reads a corpus (a JSON list of {\"id\" ... \"code\" ...}) and, in one warm
+   JVM, times each stage of rendering every pattern separately:
+
+     :eval      evaluating the code in a fork of the SCI context
+     :realize   walking the lazy result, so every sshape and point is computed
+     :validate  the cli's fast check, that the result is a sequence
+     :svg       writing the SVG document, validating each sshape as it goes
+                (groups/checked-pattern), as the cli does
+
+   Each pattern is run some warmup times and then measured over a number of
+   repetitions; the median and minimum of each stage are reported, in ms.
+
+   Usually run through scripts/bench_patterns.py, which builds the corpus
+   from the tutorial and NFTmaker sources and compares against a baseline:
+
+     lein run -m patterning.bench corpus.json results.json [--reps N] [--warmup N]"
+  (:require [patterning.dynamic :as dynamic]
+            [patterning.groups :as groups]
+            [patterning.sshapes :as sshapes]
+            [patterning.view :refer [write-svg]]
+            [sci.core :as sci]
+            [clojure.data.json :as json]
+            [clojure.java.io :as io]))
+
+(def stages [:eval :realize :validate :svg])
+
+(defn- now-ms [] (/ (System/nanoTime) 1e6))
+
+(defn realize
+  "Force a pattern completely. Returns [sshape-count point-count]."
+  [pattern]
+  (reduce (fn [[shapes points] {ps :points}]
+            [(inc shapes) (+ points (if (sshapes/packed-points? ps)
+                                      (count ps)
+                                      (count (doall ps))))])
+          [0 0] pattern))
+
+(defn run-once
+  "Run every stage once for code. Returns {:timings {stage ms} ...} or throws."
+  [sci-ctx code width height]
+  (let [t0 (now-ms)
+        result (dynamic/evaluate-pattern (sci/fork sci-ctx) code)
+        pattern (if (map? result) [result] result) ; single sshapes, as in the cli
+        t1 (now-ms)
+        [shapes points] (realize pattern)
+        t2 (now-ms)
+        valid? (sequential? pattern)
+        t3 (now-ms)
+        w (java.io.StringWriter.)
+        _ (write-svg w width height (groups/checked-pattern pattern))
+        t4 (now-ms)]
+    {:timings {:eval (- t1 t0) :realize (- t2 t1) :validate (- t3 t2) :svg (- t4 t3)}
+     :valid valid?
+     :shapes shapes
+     :points points
+     :svg-chars (.length (.getBuffer w))}))
+
+(defn- median [xs]
+  (let [xs (vec (sort xs))
+        n (count xs)]
+    (if (odd? n)
+      (nth xs (quot n 2))
+      (/ (+ (nth xs (dec (quot n 2))) (nth xs (quot n 2))) 2.0))))
+
+(defn summarize
+  "Median and minimum of each stage, and of the total, over a list of runs."
+  [runs]
+  (let [totals (map #(reduce + (vals (:timings %))) runs)
+        stat (fn [xs] {:median (median xs) :min (apply min xs)})]
+    (-> (into {} (map (fn [stage] [stage (stat (map #(get-in % [:timings stage]) runs))]) stages))
+        (assoc :total (stat totals)))))
+
+(defn bench-pattern
+  "Benchmark one corpus entry. Never throws; failures are reported in the result."
+  [sci-ctx {:keys [id code width height] :or {width 800 height 800}} reps warmup]
+  (try
+    (dotimes [_ warmup] (run-once sci-ctx code width height))
+    (let [runs (doall (repeatedly reps #(run-once sci-ctx code width height)))
+          {:keys [valid shapes points svg-chars]} (first runs)]
+      {:id id
+       :status (if valid "ok" "invalid")
+       :shapes shapes
+       :points points
+       :svg-chars svg-chars
+       :reps reps
+       :stages (summarize runs)})
+    (catch Throwable e
+      {:id id :status "error" :error (str (.getMessage e))})))
+
+(defn- parse-opts [args]
+  (loop [[a b & more :as args] args opts {:reps 5 :warmup 2}]
+    (cond
+      (empty? args) opts
+      (= a "--reps") (recur more (assoc opts :reps (Integer/parseInt b)))
+      (= a "--warmup") (recur more (assoc opts :warmup (Integer/parseInt b)))
+      :else (throw (ex-info (str "Unknown option: " a) {:arg a})))))
+
+(defn run-corpus [corpus {:keys [reps warmup]}]
+  (let [sci-ctx (dynamic/get-sci-context)]
+    (doall
+     (for [entry corpus]
+       (let [result (bench-pattern sci-ctx entry reps warmup)]
+         (println (format "%-50s %8s %10s"
+                          (:id result) (:status result)
+                          (if-let [ms (get-in result [:stages :total :median])]
+                            (format "%.2fms" (double ms))
+                            "")))
+         (flush)
+         result)))))
+
+(defn -main [& args]
+  (if (< (count args) 2)
+    (do
+      (println "Usage: lein run -m patterning.bench <corpus.json> <results.json> [--reps N] [--warmup N]")
+      (System/exit 1))
+    (let [[corpus-path output-path & more] args
+          opts (parse-opts more)
+          corpus (json/read-str (slurp corpus-path) :key-fn keyword)
+          results (run-corpus corpus opts)]
+      (io/make-parents output-path)
+      (spit output-path
+            (json/write-str {:version 1
+                             :java (System/getProperty "java.version")
+                             :clojure (clojure-version)
+                             :reps (:reps opts)
+                             :warmup (:warmup opts)
+                             :patterns results}))
+      (println (str "Wrote " output-path))
+      (shutdown-agents)
+      (System/exit 0))))
@@ -1,5 +1,5 @@
 (ns patterning.cli
-  (:require [patterning.view :refer [make-svg]]
+  (:require [patterning.view :refer [write-svg write-instanced-svg write-compact-svg optimize-for-window]]
             [patterning.groups :as groups]
             [patterning.sshapes :as sshapes]
             [patterning.layouts :as layouts]
@@ -8,6 +8,11 @@
             [patterning.color :as color]
             [patterning.maths :as maths]
             [patterning.dynamic :as dynamic]
+            [patterning.store :as store]
+            [patterning.raster :as raster]
+            [sci.core :as sci]
+            [clojure.data.json :as json]
+            [clojure.edn :as edn]
             [clojure.java.io :as io]
             [clojure.string :as str]
             [clojure.pprint :as pp]))
@@ -176,62 +181,187 @@
       (catch Exception e
         (println (str "DEBUG: Error evaluating definitions: " (.getMessage e)))))))
 
+(def ^:dynamic *diagnostics*
+  "When true, a failing pattern also gets the deeper diagnostics: regex checks
+   of its source, step by step evaluation of its definitions and a stack trace.
+   These evaluate the pattern again, so they're off unless --diagnostics is given."
+  false)
+
+(def ^:dynamic *error-sidecar*
+  "When true, the structured error for a failed render is also written as JSON
+   next to its output, at <output>.error.json. Set by --error-sidecar."
+  false)
+
+(def ^:private error-kinds
+  [["unresolved-symbol" #"(?:Unable to|Could not) resolve symbol: ([^\s,]+)"]
+   ["wrong-arity" #"Wrong number of args.*passed to: ([^\s,]+)"]
+   ["no-such-var" #"No such var: ([^\s,]+)"]
+   ["missing-protocol" #"No implementation of method: ([^\s,]+)"]
+   ["class-cast" #"(\S+) cannot be cast to"]
+   ["divide-by-zero" #"Divide by zero"]
+   ["missing-key" #"No value supplied for key: (\S+)"]])
+
+(defn pattern-error
+  "Describe a failure as a map ready to write as JSON: its :kind, :message,
+   the :symbol involved (when there is one), its :location in the pattern
+   source ({:line :column}, when SCI knows it), the :phase it happened in and
+   how many :ms that phase had run."
+  [e phase source-name ms]
+  (let [chain (take-while some? (iterate #(.getCause ^Throwable %) e))
+        messages (keep #(.getMessage ^Throwable %) chain)
+        [kind match] (or (first (for [[kind re] error-kinds
+                                      message messages
+                                      :let [m (re-find re message)]
+                                      :when m]
+                                  [kind m]))
+                         ["exception" nil])
+        {:keys [line column]} (some #(let [data (ex-data %)] (when (:line data) data)) chain)]
+    {:kind kind
+     :message (or (first messages) (.getName (class e)))
+     :symbol (when (vector? match) (second match))
+     :source source-name
+     :location (when line {:line line :column column})
+     :phase phase
+     :ms ms}))
+
+(defn report-pattern-error
+  "Write a structured pattern error to stderr, as one JSON line."
+  [error]
+  (binding [*out* *err*]
+    (println (str "PATTERN-ERROR " (json/write-str error)))
+    (flush)))
+
+(defn write-error-sidecar
+  "With *error-sidecar*, write error as JSON to <output>.error.json, or remove a
+   stale one when error is nil."
+  [output error]
+  (when (and *error-sidecar* output)
+    (let [sidecar (io/file (str output ".error.json"))]
+      (if error
+        (spit sidecar (json/write-str error))
+        (.delete sidecar)))))
+
+(defn- run-diagnostics
+  "The opt-in deeper diagnostics for a failed evaluation."
+  [sci-ctx content source-name e]
+  (if e
+    (do
+      (extract-clean-error e source-name)
+      (diagnose-common-issues content e)
+      (debug-pattern-evaluation content source-name)
+      (println "ERROR: Full stack trace:")
+      (.printStackTrace e))
+    (let [error-result (dynamic/evaluate-pattern-with-error-handling sci-ctx content)]
+      (analyze-pattern-result nil source-name)
+      (when-not (:success error-result)
+        (println "ERROR: Found hidden exception:")
+        (println (str "ERROR: " (.getMessage (:error error-result))))
+        (.printStackTrace (:error error-result))))))
+
+(defn read-pattern-code
+  "Evaluate pattern source code, once, in the given SCI context.
+   source-name is only used to label error messages. A failure is reported on
+   stderr as a structured error (see pattern-error) and thrown as an ex-info
+   carrying it under :pattern-error. With *diagnostics* the deeper diagnostics
+   are run as well."
+  [sci-ctx content source-name]
+  (let [start (System/nanoTime)
+        elapsed #(/ (- (System/nanoTime) start) 1e6)
+        fail (fn [error e]
+               (report-pattern-error error)
+               (when *diagnostics*
+                 (run-diagnostics sci-ctx content source-name e))
+               (throw (ex-info (:message error) {:pattern-error error} e)))
+        result (try
+                 (dynamic/evaluate-pattern sci-ctx content)
+                 (catch Exception e
+                   (fail (pattern-error e "eval" source-name (elapsed)) e)))]
+    (when (nil? result)
+      (fail {:kind "nil-result"
+             :message "Pattern evaluation returned nil; the final expression should return a pattern"
+             :symbol nil :source source-name :location nil :phase "eval" :ms (elapsed)}
+            nil))
+    (if (map? result) [result] result))) ; Wrap single maps
+
 (defn read-pattern-file [filepath]
   "Read and evaluate a pattern from a file using shared SCI context"
-  (let [content (slurp filepath)
-        sci-ctx (dynamic/get-sci-context)]
+  (read-pattern-code (dynamic/get-sci-context) (slurp filepath) filepath))
+
+
+(defn validate-pattern
+  "Validate that the pattern is a valid Group. mode :full (the default) checks
+   every point up front. :fast only checks that it's a sequence, without
+   walking it, and leaves the sshapes to groups/checked-pattern, which checks
+   each one fully as it's rendered; so the pattern is walked once, not twice.
+   The detailed explanation is only worked out when the check fails."
+  ([pattern] (validate-pattern :full pattern))
+  ([mode pattern]
     (try
-      (let [result (dynamic/evaluate-pattern sci-ctx content)
-            pattern (if (map? result) [result] result)] ; Wrap single maps
-        (when (nil? result)
-          (analyze-pattern-result result filepath)
-          ;; Try with error handling to see if there's a hidden exception
-          (let [error-result (dynamic/evaluate-pattern-with-error-handling sci-ctx content)]
-            (when-not (:success error-result)
-              (println "ERROR: Found hidden exception:")
-              (println (str "ERROR: " (.getMessage (:error error-result))))
-              (println "ERROR: Stack trace:")
-              (.printStackTrace (:error error-result)))))
-        pattern)
+      (if (if (= mode :fast) (sequential? pattern) (groups/validate-group pattern))
+        true
+        (do
+          (println "ERROR: Pattern validation failed")
+          (println (str "Invalid pattern: " (groups/explain-group pattern)))
+          (let [error-file "failed-pattern.edn"]
+            (spit error-file (with-out-str (pp/pprint pattern)))
+            (println (str "ERROR: The invalid pattern data has been written to " error-file)))
+          false))
       (catch Exception e
-        (println "ERROR: Failed to evaluate pattern")
-        (extract-clean-error e filepath)
-        (diagnose-common-issues content e)
-        (debug-pattern-evaluation content filepath)
-        (println "ERROR: Full stack trace:")
+        (println "ERROR: Exception during pattern validation")
+        (extract-clean-error e "pattern validation")
+        (let [error-file "failed-pattern.edn"]
+          (spit error-file (with-out-str (pp/pprint pattern)))
+          (println (str "ERROR: The pattern that failed validation has been written to " error-file)))
         (.printStackTrace e)
-        (throw e)))))
+        false))))
 
+(defn- write-output
+  "Call (write out) with out opened by open (io/writer or io/output-stream) on
+   a temp file beside output-path, and move the file into place once it's
+   written. A pattern that fails part way through rendering (see
+   groups/checked-pattern) then leaves no partial file behind."
+  [output-path open write]
+  (let [target (io/file output-path)
+        tmp (java.io.File/createTempFile "render" ".tmp" (.getParentFile (.getAbsoluteFile target)))]
+    (try
+      (with-open [out (open tmp)]
+        (write out))
+      (java.nio.file.Files/move (.toPath tmp) (.toPath target)
+                                (into-array [java.nio.file.StandardCopyOption/REPLACE_EXISTING]))
+      (finally
+        (.delete tmp)))))
 
-(defn validate-pattern [pattern]
-  "Validate that the pattern is a valid Group"
-  (try
-    (if (groups/validate-group pattern)
-      true
-      (do
-        (println "ERROR: Pattern validation failed")
-        (println (str "Invalid pattern: " (groups/explain-group pattern)))
+(defn generate-svg
+  "Generate SVG from pattern and write to file. svg-writer is write-svg, or
+   write-instanced-svg to draw repeated tiles once and place them with <use>."
+  ([pattern output-path width height] (generate-svg pattern output-path width height write-svg))
+  ([pattern output-path width height svg-writer]
+    (try
+      ;; Streamed to the file, so the document is never held in memory
+      (write-output output-path io/writer #(svg-writer % width height pattern))
+      (println (str "Generated SVG: " output-path))
+      (catch Exception e
+        (println "ERROR: Failed to generate SVG")
+        (extract-clean-error e output-path)
         (let [error-file "failed-pattern.edn"]
           (spit error-file (with-out-str (pp/pprint pattern)))
-          (println (str "ERROR: The invalid pattern data has been written to " error-file)))
-        false))
-    (catch Exception e
-      (println "ERROR: Exception during pattern validation")
-      (extract-clean-error e "pattern validation")
-      (let [error-file "failed-pattern.edn"]
-        (spit error-file (with-out-str (pp/pprint pattern)))
-        (println (str "ERROR: The pattern that failed validation has been written to " error-file)))
-      (.printStackTrace e)
-      false)))
+          (println (str "ERROR: The failing pattern data has been written to " error-file)))
+        (throw e)))))
 
-(defn generate-svg [pattern output-path width height]
-  "Generate SVG from pattern and write to file"
+(def svg-writers
+  "The SVG output formats, and the view function that writes each one"
+  {"svg" write-svg
+   "svg-instanced" write-instanced-svg
+   "svg-compact" write-compact-svg})
+
+(defn generate-png
+  "Draw pattern with Java2D and write it to file as a PNG image"
+  [pattern output-path width height]
   (try
-    (let [svg-content (make-svg width height pattern)]
-      (spit output-path svg-content)
-      (println (str "Generated SVG: " output-path)))
+    (write-output output-path io/output-stream #(raster/write-png % width height pattern))
+    (println (str "Generated PNG: " output-path))
     (catch Exception e
-      (println "ERROR: Failed to generate SVG")
+      (println "ERROR: Failed to generate PNG")
       (extract-clean-error e output-path)
       (let [error-file "failed-pattern.edn"]
         (spit error-file (with-out-str (pp/pprint pattern)))
@@ -243,37 +373,298 @@
   ;; TODO: Implement PostScript generation
   (println "PostScript generation not yet implemented"))
 
+(defn read-pattern-input
+  "Read the pattern at input-path: a saved .ptrn pattern is loaded as is,
+   anything else is evaluated as pattern source."
+  [input-path]
+  (if (str/ends-with? input-path ".ptrn")
+    (store/load-pattern input-path)
+    (read-pattern-file input-path)))
+
+(defn save-evaluated-pattern
+  "Evaluate the pattern source at input-path and save the result to output-path,
+   so it can be rendered later without evaluating it again."
+  [input-path output-path]
+  (try
+    (let [pattern (read-pattern-file input-path)]
+      (when-not (validate-pattern pattern)
+        (println "ERROR: Pattern validation failed")
+        (System/exit 1))
+      (when-not (store/storable? pattern)
+        (println "ERROR: Pattern has styles that can't be saved")
+        (System/exit 1))
+      (store/save-pattern output-path pattern)
+      (println (str "Saved pattern: " output-path)))
+    (catch Exception e
+      (println "ERROR: Error saving pattern:" (.getMessage e))
+      (System/exit 1))))
+
 (defn process-pattern-file [input-path output-path format width height]
   "Main processing function"
   (try
     (println (str "Processing: " input-path))
-    (let [pattern (read-pattern-file input-path)]
+    (let [pattern (read-pattern-input input-path)]
       (if (validate-pattern pattern)
         (case format
           "svg" (generate-svg pattern output-path width height)
+          "svg-instanced" (generate-svg pattern output-path width height write-instanced-svg)
+          "svg-compact" (generate-svg pattern output-path width height write-compact-svg)
+          "png" (generate-png pattern output-path width height)
           "ps" (generate-ps pattern output-path width height)
           (do
             (println "ERROR: Unsupported format:" format)
-            (println "ERROR: Supported formats are: svg, ps")
+            (println "ERROR: Supported formats are: svg, svg-instanced, svg-compact, png, ps")
             (System/exit 1)))
         (do
           (println "ERROR: Pattern validation failed")
+          (write-error-sidecar output-path {:kind "invalid-pattern" :message "Pattern validation failed"
+                                            :source input-path :phase "validate"})
           (System/exit 1))))
     (catch Exception e
       (println "ERROR: Error processing file:" (.getMessage e))
+      (write-error-sidecar output-path (or (:pattern-error (ex-data e))
+                                           (pattern-error e "render" input-path nil)))
       (System/exit 1))))
 
+(defn job-size
+  "Width and height for a job. :size may be a single number for a square
+   output or a [width height] pair; otherwise :width and :height are used."
+  [{:keys [size width height] :or {width 800 height 800}}]
+  (cond
+    (number? size) [size size]
+    (sequential? size) (vec size)
+    :else [width height]))
+
+(defmacro ^:private timed
+  "Evaluate body, adding the time it took (in ms) to the timings atom under k."
+  [timings k & body]
+  `(let [start# (System/nanoTime)]
+     (try ~@body
+          (finally
+            (swap! ~timings assoc ~k (/ (- (System/nanoTime) start#) 1e6))))))
+
+(def ^:dynamic *pattern-cache*
+  "Directory of the pattern store used by render jobs that don't name their own
+   :pattern-cache, or nil to always evaluate. Set by --pattern-cache."
+  nil)
+
+(def ^:dynamic *validation*
+  "How render jobs validate patterns when they don't give :validate: :fast
+   validates each sshape while the output is written; :full checks every
+   point first. Set by --full-validation."
+  :fast)
+
+(defn- job-pattern
+  "The pattern for a job, and whether it came from the store. A saved .ptrn
+   :input is loaded as is. Otherwise, with a cache directory, the store is
+   checked before evaluating. Returns [pattern cached? code], or nil if the
+   pattern isn't valid."
+  [sci-ctx {:keys [id code input]} cache validation timings]
+  (if (and input (not code) (str/ends-with? input ".ptrn"))
+    [(timed timings :load (store/load-pattern input)) true nil]
+    (let [content (or code (slurp input))]
+      (if-let [saved (when cache (timed timings :load (store/lookup cache content)))]
+        [saved true content]
+        (let [pattern (timed timings :eval
+                        (read-pattern-code (sci/fork sci-ctx) content (or input (str "job " id))))]
+          (when (timed timings :validate (validate-pattern validation pattern))
+            [pattern false content]))))))
+
+(defn render-job
+  "Render a single job map {:code or :input, :output, :format, :width, :height}.
+   Each job is evaluated in a fork of the warm sci-ctx, so definitions made by one
+   pattern don't leak into the next. Never exits the JVM; returns a result map
+   with :status \"ok\" or \"error\", and :timings giving the milliseconds spent
+   in each stage (:load, :eval, :validate, :svg or :png, :store) that was reached.
+   With :optimize true (or a map of options for view/optimize-for-window) the
+   pattern is culled and simplified for the output size before it's written.
+   :validate is \"fast\" or \"full\" (default *validation*, see validate-pattern).
+   With a :pattern-cache directory (default *pattern-cache*) patterns already
+   evaluated from the same code are loaded instead of evaluated, and :cached
+   says whether that happened; a newly evaluated pattern is saved there once
+   it has rendered, by which time every sshape has passed the full check,
+   before rendering (:full) or as it was drawn (:fast). A failed job's result has a
+   structured :failure (see pattern-error), also written beside the output
+   with *error-sidecar*."
+  [sci-ctx {:keys [id output format optimize pattern-cache validate]
+            :or {format "svg"}
+            :as job}]
+  (let [result {:id id :output output}
+        source-name (or (:input job) (str "job " id))
+        [width height] (job-size job)
+        validation (if validate (keyword validate) *validation*)
+        cache (or pattern-cache *pattern-cache*)
+        timings (atom {})
+        outcome (try
+                  (let [[pattern cached code] (job-pattern sci-ctx job cache validation timings)]
+                    (cond
+                      (nil? pattern)
+                      (assoc result :status "error" :error "Pattern validation failed"
+                             :failure {:kind "invalid-pattern" :message "Pattern validation failed"
+                                       :source source-name :phase "validate"})
+
+                      (or (svg-writers format) (= "png" format))
+                      (let [checked (if (and (= validation :fast) (not cached))
+                                      (groups/checked-pattern pattern)
+                                      pattern)
+                            drawn (if optimize
+                                    (optimize-for-window [-1 -1 1 1] [0 0 width height]
+                                                         (if (map? optimize) optimize {}) checked)
+                                    checked)]
+                        (if (= "png" format)
+                          (timed timings :png (generate-png drawn output width height))
+                          (timed timings :svg (generate-svg drawn output width height (svg-writers format))))
+                        (when (and cache (not cached))
+                          (try
+                            (timed timings :store (store/store! cache code pattern))
+                            (catch Exception e
+                              (println (str "WARNING: Couldn't save pattern to " cache ": " (.getMessage e))))))
+                        (assoc result :status "ok" :cached cached))
+
+                      :else
+                      (assoc result :status "error" :error (str "Unsupported format: " format))))
+                  (catch Exception e
+                    (let [{:keys [pattern-error explanation]} (ex-data e)]
+                      (assoc result :status "error" :error (str (.getMessage e))
+                             :failure (cond
+                                        pattern-error pattern-error
+                                        explanation {:kind "invalid-pattern" :message (str (.getMessage e))
+                                                     :explanation explanation :source source-name
+                                                     :phase "svg"}
+                                        :else (pattern-error e "render" source-name nil))))))]
+    (write-error-sidecar output (:failure outcome))
+    (assoc outcome :timings @timings)))
+
+(defn parse-job-line
+  "Parse one line of a job stream. Lines may be JSON objects or EDN maps."
+  [line]
+  (if (re-find #"^\s*\{\s*\"" line)
+    (json/read-str line :key-fn keyword)
+    (edn/read-string line)))
+
+(defn- render-entry
+  "Render a job given either as a map or as an unparsed line, turning a
+   malformed line into an error result for that job only."
+  [sci-ctx entry]
+  (try
+    (render-job sci-ctx (if (string? entry) (parse-job-line entry) entry))
+    (catch Exception e
+      {:status "error" :error (str "Malformed job: " (.getMessage e))})))
+
+(defn- protocol-writer
+  "Returns a function that writes a result map as one JSON line to the current *out*,
+   even when called from inside a binding that redirects *out*."
+  []
+  (let [protocol-out *out*]
+    (fn [m]
+      (binding [*out* protocol-out]
+        (println (json/write-str m))
+        (flush)))))
+
+(defn- stdin-lines []
+  (remove str/blank? (line-seq (io/reader *in*))))
+
+(defn serve
+  "Long-lived render server. Reads one job per line from stdin and writes one
+   JSON result per line to stdout, starting with a {\"status\": \"ready\"} line once
+   the SCI context is warm. All diagnostic printing is redirected to stderr so that
+   stdout only carries protocol lines."
+  []
+  (let [sci-ctx (dynamic/get-sci-context)
+        respond (protocol-writer)]
+    (respond {:status "ready"})
+    (binding [*out* *err*]
+      (doseq [line (stdin-lines)]
+        (respond (render-entry sci-ctx line))))))
+
+(defn read-batch-jobs
+  "Read the jobs of a batch manifest. A path ending in .edn holds an EDN vector of
+   job maps and any other path a JSON array of job objects. With no path, or \"-\",
+   jobs are read from stdin, one JSON or EDN map per line."
+  [path]
+  (cond
+    (or (nil? path) (= path "-")) (stdin-lines)
+    (str/ends-with? path ".edn") (edn/read-string (slurp path))
+    :else (json/read-str (slurp path) :key-fn keyword)))
+
+(defn run-batch
+  "Render every job from the manifest at path with one shared SCI context.
+   Writes one JSON result line per job to stdout as it finishes and returns
+   the results. A failing job doesn't stop the rest of the batch."
+  [path]
+  (let [sci-ctx (dynamic/get-sci-context)
+        respond (protocol-writer)
+        jobs (read-batch-jobs path)]
+    (binding [*out* *err*]
+      (doall
+       (for [job jobs]
+         (let [result (render-entry sci-ctx job)]
+           (respond result)
+           result))))))
+
 (defn -main [& args]
   "Command line interface for Patterning"
-  (if (< (count args) 3)
+  (cond
+    (= (first args) "--pattern-cache")
+    (binding [*pattern-cache* (second args)]
+      (store/prune! *pattern-cache*)
+      (apply -main (drop 2 args)))
+
+    (= (first args) "--diagnostics")
+    (binding [*diagnostics* true]
+      (apply -main (rest args)))
+
+    (= (first args) "--error-sidecar")
+    (binding [*error-sidecar* true]
+      (apply -main (rest args)))
+
+    (= (first args) "--full-validation")
+    (binding [*validation* :full]
+      (apply -main (rest args)))
+
+    (= (first args) "--server")
+    (serve)
+
+    (= (first args) "--batch")
+    (let [results (run-batch (second args))]
+      (System/exit (if (every? #(= "ok" (:status %)) results) 0 1)))
+
+    (and (= (first args) "--eval") (= (count args) 3))
+    (save-evaluated-pattern (nth args 1) (nth args 2))
+
+    (< (count args) 3)
     (do
-      (println "Usage: lein run -m patterning.cli <input-file> <output-file> <format> [width] [height]")
-      (println "  input-file:  Path to ClojureScript pattern file")
+      (println "Usage: lein run -m patterning.cli [options] <input-file> <output-file> <format> [width] [height]")
+      (println "       lein run -m patterning.cli --eval <input-file> <output.ptrn>")
+      (println "       lein run -m patterning.cli [options] --batch [manifest.json | manifest.edn | -]")
+      (println "       lein run -m patterning.cli [options] --server")
+      (println "  input-file:  Path to ClojureScript pattern file, or a pattern saved with --eval")
       (println "  output-file: Path for output file")
-      (println "  format:      svg or ps")
-      (println "  width:       SVG width (default: 800)")
-      (println "  height:      SVG height (default: 800)")
+      (println "  format:      svg, svg-instanced (repeated tiles drawn once), svg-compact (rounded")
+      (println "               coordinates, relative paths and CSS style classes, for serving),")
+      (println "               png (drawn with Java2D, for thumbnails and previews) or ps")
+      (println "  width:       Output width (default: 800)")
+      (println "  height:      Output height (default: 800)")
+      (println "  --eval:      Evaluate a pattern once and save the result, to render later at any size")
+      (println "  --batch:     Render every job in a manifest (or one job per line on stdin),")
+      (println "               printing one JSON result line per job")
+      (println "  --server:    Read render jobs, one per line, from stdin")
+      (println "  options:")
+      (println "  --pattern-cache DIR: Keep evaluated patterns in DIR, keyed by their code and the")
+      (println "               library version, and render repeats without evaluating them. Its least")
+      (println "               recently used entries are pruned on start, down to 256MB")
+      (println "  --error-sidecar: Write the structured error for a failed render to <output>.error.json")
+      (println "  --full-validation: Check every point of a job's pattern before rendering, rather")
+      (println "               than checking each sshape as the output is written")
+      (println "  --diagnostics: Also run the slower diagnostics on a failing pattern, which")
+      (println "               evaluate it again; failures are always reported on stderr as")
+      (println "               PATTERN-ERROR lines of JSON")
+      (println "  Jobs are maps with :code or :input, :output, :format and :size or :width/:height,")
+      (println "  and optionally :optimize to cull and simplify the pattern for the output size")
+      (println "  and :validate \"fast\" or \"full\"")
       (System/exit 1))
+
+    :else
     (let [[input-path output-path format & rest-args] args
           width (if (first rest-args) (Integer/parseInt (first rest-args)) 800)
           height (if (second rest-args) (Integer/parseInt (second rest-args)) 800)]
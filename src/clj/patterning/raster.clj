@@ -0,0 +1,139 @@
+(ns patterning.raster
+  "Patterns drawn straight to raster images with Java2D, for PNG output.
+
+   The same SShape data the SVG writers take is drawn with the same meaning:
+   points are mapped from viewport to window, :bezier sshapes are a start
+   point followed by (control control end) triples, the stroke defaults to
+   opaque black and is drawn over any fill, and :stroke-weight is in pixels
+   (default 1), whatever the scale. Colors are p-colors [r g b a], with alpha
+   from 0 to 255. Images are antialiased, on a transparent background unless
+   a :background color is given.
+
+   Nothing here needs a display, so it runs on headless servers."
+  (:require [patterning.sshapes :as sshapes]
+            [patterning.color :refer [p-color]])
+  (:import [java.awt BasicStroke Color Graphics2D RenderingHints]
+           [java.awt.geom AffineTransform Path2D$Double]
+           [java.awt.image BufferedImage]
+           [javax.imageio ImageIO]))
+
+;; Must be set before anything touches the AWT toolkit
+(when-not (System/getProperty "java.awt.headless")
+  (System/setProperty "java.awt.headless" "true"))
+
+(defn- channel [x]
+  (int (min 255 (max 0 (Math/round (double x))))))
+
+(defn awt-color
+  "The java.awt.Color for a p-color"
+  [[r g b a]]
+  (Color. (int (channel r)) (int (channel g)) (int (channel b)) (int (channel (or a 255)))))
+
+(defn window-transform
+  "The AffineTransform mapping viewport onto window, as maths/tx does."
+  [[vx1 vy1 vx2 vy2] [wx1 wy1 wx2 wy2]]
+  (let [sx (double (/ (double (- wx2 wx1)) (- vx2 vx1)))
+        sy (double (/ (double (- wy2 wy1)) (- vy2 vy1)))]
+    (AffineTransform. sx 0.0 0.0 sy (double (- wx1 (* sx vx1))) (double (- wy1 (* sy vy1))))))
+
+(defn- point-coords
+  "The points as a flat array of coordinates [x0 y0 x1 y1 ...]. Packed points
+   are read straight from their array."
+  ^doubles [points]
+  (if (sshapes/packed-points? points)
+    (sshapes/packed-coords points)
+    (let [points (vec points)
+          coords (double-array (* 2 (count points)))]
+      (dotimes [i (count points)]
+        (let [[x y] (nth points i)]
+          (aset coords (* 2 i) (double x))
+          (aset coords (inc (* 2 i)) (double y))))
+      coords)))
+
+(defn sshape-path
+  "The points of sshape as a Java2D path, in the sshape's own coordinates."
+  [{:keys [style points]}]
+  (let [path (Path2D$Double.)
+        ^doubles coords (point-coords points)
+        n (quot (alength coords) 2)
+        x (fn ^double [^long i] (aget coords (* 2 i)))
+        y (fn ^double [^long i] (aget coords (inc (* 2 i))))]
+    (when (pos? n)
+      (.moveTo path (x 0) (y 0))
+      (if (contains? style :bezier)
+        (loop [i 1]
+          (when (<= (+ i 3) n)
+            (.curveTo path (x i) (y i) (x (+ i 1)) (y (+ i 1)) (x (+ i 2)) (y (+ i 2)))
+            (recur (+ i 3))))
+        (loop [i 1]
+          (when (< i n)
+            (.lineTo path (x i) (y i))
+            (recur (inc i))))))
+    path))
+
+(defn- stroke-for
+  "A BasicStroke of weight pixels, with SVG's default caps, joins and miter limit"
+  [weight]
+  (BasicStroke. (float weight) BasicStroke/CAP_BUTT BasicStroke/JOIN_MITER (float 4)))
+
+(defn draw-pattern
+  "Draw group onto the Graphics2D g, mapping viewport onto window. Paths are
+   transformed before they're stroked, so stroke weights aren't scaled."
+  [^Graphics2D g viewport window group]
+  (let [at (window-transform viewport window)
+        strokes (volatile! {})]
+    (doseq [{:keys [style] :as sshape} group]
+      (let [path (doto ^Path2D$Double (sshape-path sshape) (.transform at))
+            weight (double (get style :stroke-weight 1))]
+        (when (contains? style :fill)
+          (.setColor g (awt-color (:fill style)))
+          (.fill g path))
+        ;; SVG draws nothing for a zero width stroke, Java2D a hairline
+        (when (pos? weight)
+          (.setColor g (awt-color (get style :stroke (p-color 0))))
+          (.setStroke g (or (get @strokes weight)
+                            (let [s (stroke-for weight)]
+                              (vswap! strokes assoc weight s)
+                              s)))
+          (.draw g path))))))
+
+(defn render-image
+  "Draw group onto a new width x height ARGB BufferedImage. opts may give
+   :background, a p-color to fill the image with first (default transparent),
+   and :antialias (default true)."
+  ([viewport window width height group] (render-image viewport window width height {} group))
+  ([viewport window width height {:keys [background antialias] :or {antialias true}} group]
+   (let [image (BufferedImage. (int width) (int height) BufferedImage/TYPE_INT_ARGB)
+         g (.createGraphics image)]
+     (try
+       (when antialias
+         (doto g
+           (.setRenderingHint RenderingHints/KEY_ANTIALIASING RenderingHints/VALUE_ANTIALIAS_ON)
+           (.setRenderingHint RenderingHints/KEY_STROKE_CONTROL RenderingHints/VALUE_STROKE_PURE)
+           (.setRenderingHint RenderingHints/KEY_RENDERING RenderingHints/VALUE_RENDER_QUALITY)))
+       (when background
+         (.setColor g (awt-color background))
+         (.fillRect g 0 0 (int width) (int height)))
+       (draw-pattern g viewport window group)
+       image
+       (finally
+         (.dispose g)))))
+  ([width height group] (render-image [-1 -1 1 1] [0 0 width height] width height {} group)))
+
+(defn write-png
+  "Write group as a PNG image to sink, a java.io.OutputStream, which is left
+   open. opts are as for render-image."
+  ([sink viewport window width height group] (write-png sink viewport window width height {} group))
+  ([sink viewport window width height opts group]
+   (when-not (ImageIO/write ^BufferedImage (render-image viewport window width height opts group)
+                            "png" ^java.io.OutputStream sink)
+     (throw (ex-info "No PNG image writer available" {}))))
+  ([sink width height group] (write-png sink [-1 -1 1 1] [0 0 width height] width height {} group)))
+
+(defn make-png
+  "The PNG image of group as a byte array"
+  ([viewport window width height group]
+   (let [out (java.io.ByteArrayOutputStream.)]
+     (write-png out viewport window width height group)
+     (.toByteArray out)))
+  ([width height group] (make-png [-1 -1 1 1] [0 0 width height] width height group)))
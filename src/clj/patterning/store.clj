@@ -0,0 +1,169 @@
+(ns patterning.store
+  "Evaluated patterns saved in a compact binary form, so a pattern can be
+   rendered again, at any size or in any format, without evaluating its code.
+
+   A .ptrn file is:
+
+     magic \"PTRN\", format version (int)
+     style count (int), then each distinct style as an EDN string (UTF)
+     sshape count (int), then for each sshape:
+       style index (int), point count (int), x y ... (doubles)
+
+   Points are read back as packed points (see sshapes/pack-points).
+
+   A store is a directory of these, keyed by a hash of the pattern code and of
+   the library sources, so editing either makes a fresh entry. Stale entries
+   are never looked up again, so prune! keeps the store under a size limit by
+   removing the least recently used."
+  (:require [patterning.sshapes :as sshapes]
+            [clojure.edn :as edn]
+            [clojure.java.io :as io]
+            [clojure.string :as str])
+  (:import [java.io DataInputStream DataOutputStream BufferedInputStream BufferedOutputStream File]
+           [java.security MessageDigest]
+           [java.nio.file Files StandardCopyOption]))
+
+(def magic "PTRN")
+(def format-version 1)
+
+(defn- readable-style?
+  "True if style survives being written as EDN and read back."
+  [style]
+  (try
+    (= style (edn/read-string (pr-str style)))
+    (catch Exception _ false)))
+
+(defn storable?
+  "Can pattern be saved? Every sshape needs a style that round trips through EDN."
+  [pattern]
+  (every? #(and (map? %) (readable-style? (:style %))) pattern))
+
+(defn write-pattern
+  "Write pattern to a java.io.OutputStream"
+  [out pattern]
+  (let [shapes (vec pattern)
+        styles (vec (distinct (map :style shapes)))
+        style-index (zipmap styles (range))
+        dos (DataOutputStream. (BufferedOutputStream. out))]
+    (.writeBytes dos magic)
+    (.writeInt dos format-version)
+    (.writeInt dos (count styles))
+    (doseq [style styles]
+      (.writeUTF dos (pr-str style)))
+    (.writeInt dos (count shapes))
+    (doseq [{:keys [style points]} shapes]
+      (.writeInt dos (int (style-index style)))
+      (if (sshapes/packed-points? points)
+        (let [^doubles coords (sshapes/packed-coords points)]
+          (.writeInt dos (quot (alength coords) 2))
+          (dotimes [i (alength coords)]
+            (.writeDouble dos (aget coords i))))
+        (let [points (vec points)]
+          (.writeInt dos (count points))
+          (doseq [[x y] points]
+            (.writeDouble dos (double x))
+            (.writeDouble dos (double y))))))
+    (.flush dos)))
+
+(defn read-pattern
+  "Read a pattern written by write-pattern from a java.io.InputStream"
+  [in]
+  (let [dis (DataInputStream. (BufferedInputStream. in))
+        header (String. (let [b (byte-array 4)] (.readFully dis b) b) "US-ASCII")]
+    (when-not (= header magic)
+      (throw (ex-info "Not a saved pattern" {:header header})))
+    (let [version (.readInt dis)]
+      (when-not (= version format-version)
+        (throw (ex-info "Unsupported saved pattern version" {:version version}))))
+    (let [styles (vec (repeatedly (.readInt dis) #(edn/read-string (.readUTF dis))))]
+      (vec (repeatedly (.readInt dis)
+                       (fn []
+                         (let [style (nth styles (.readInt dis))
+                               coords (double-array (* 2 (.readInt dis)))]
+                           (dotimes [i (alength coords)]
+                             (aset coords i (.readDouble dis)))
+                           (sshapes/->SShape style (sshapes/->PackedPoints coords)))))))))
+
+(defn save-pattern
+  "Save pattern to path, atomically, so concurrent readers never see half a file."
+  [path pattern]
+  (let [target (io/file path)
+        _ (io/make-parents target)
+        tmp (File/createTempFile "pattern" ".tmp" (.getParentFile (.getAbsoluteFile target)))]
+    (try
+      (with-open [out (io/output-stream tmp)]
+        (write-pattern out pattern))
+      (Files/move (.toPath tmp) (.toPath target)
+                  (into-array [StandardCopyOption/REPLACE_EXISTING StandardCopyOption/ATOMIC_MOVE]))
+      (finally
+        (.delete tmp)))))
+
+(defn load-pattern [path]
+  (with-open [in (io/input-stream path)]
+    (read-pattern in)))
+
+;; Hash keyed store
+
+(defn- sha-256 [& parts]
+  (let [digest (MessageDigest/getInstance "SHA-256")]
+    (doseq [part parts]
+      (.update digest (.getBytes (str part) "UTF-8")))
+    (apply str (map #(format "%02x" %) (.digest digest)))))
+
+(def library-fingerprint
+  "Hash of the sources of every loaded patterning namespace"
+  (delay
+    (apply sha-256
+           (for [ns-name (sort (map (comp str ns-name) (all-ns)))
+                 :when (str/starts-with? ns-name "patterning.")
+                 :let [base (-> ns-name (str/replace "-" "_") (str/replace "." "/"))
+                       resource (some io/resource [(str base ".cljc") (str base ".clj")])]
+                 :when resource]
+             (str ns-name (slurp resource))))))
+
+(defn pattern-key [code]
+  (sha-256 format-version "\n" @library-fingerprint "\n" code))
+
+(defn- entry-file [dir key]
+  (io/file dir (subs key 0 2) (str key ".ptrn")))
+
+(defn lookup
+  "The saved pattern for code in the store at dir, or nil."
+  [dir code]
+  (let [f (entry-file dir (pattern-key code))]
+    (when (.exists f)
+      (try
+        (let [pattern (load-pattern f)]
+          ;; so prune! sees it was used
+          (.setLastModified f (System/currentTimeMillis))
+          pattern)
+        (catch Exception _ nil)))))
+
+(defn store!
+  "Save the pattern evaluated from code in the store at dir. Returns true if it
+   was saved; patterns with styles that can't be saved are skipped."
+  [dir code pattern]
+  (when (storable? pattern)
+    (save-pattern (entry-file dir (pattern-key code)) pattern)
+    true))
+
+(def default-max-bytes
+  "The size a store is pruned to by default"
+  (* 256 1024 1024))
+
+(defn prune!
+  "Remove the least recently used entries of the store at dir until the rest
+   take up no more than max-bytes. Returns the number removed."
+  ([dir] (prune! dir default-max-bytes))
+  ([dir max-bytes]
+   (let [entries (->> (file-seq (io/file dir))
+                      (filter #(and (.isFile ^File %) (str/ends-with? (.getName ^File %) ".ptrn")))
+                      (sort-by #(.lastModified ^File %)))]
+     (loop [entries entries
+            total (reduce + 0 (map #(.length ^File %) entries))
+            removed 0]
+       (if (and (seq entries) (> total max-bytes))
+         (let [^File f (first entries)
+               size (.length f)]
+           (recur (rest entries) (- total size) (if (.delete f) (inc removed) removed)))
+         removed)))))
@@ -0,0 +1,140 @@
+(ns patterning.cli-test
+  (:require [clojure.test :refer :all]
+            [clojure.java.io :as io]
+            [patterning.cli :as cli]
+            [patterning.dynamic :as dynamic]
+            [patterning.store :as store]
+            [sci.core]))
+
+(def sci-ctx (dynamic/get-sci-context))
+
+(defn temp-path [suffix]
+  (let [f (java.io.File/createTempFile "patterning-cli-test" suffix)]
+    (.deleteOnExit f)
+    (.getPath f)))
+
+(deftest render-job-writes-svg
+  (testing "a good job renders and reports ok"
+    (let [out (temp-path ".svg")
+          result (cli/render-job sci-ctx {:id 1 :code "(poly 5 0.5 0 0 {:stroke (p-color 255 0 0)})"
+                                          :output out :width 200 :height 200})]
+      (is (= "ok" (:status result)))
+      (is (= 1 (:id result)))
+      (is (.startsWith (slurp out) "<svg"))
+      (is (every? number? (map (:timings result) [:eval :validate :svg])))))
+
+  (testing "a png job is drawn as an image of the job's size"
+    (let [out (temp-path ".png")
+          result (cli/render-job sci-ctx {:id 8 :code "(poly 5 0.5 0 0 {:stroke (p-color 255 0 0)})"
+                                          :output out :format "png" :size 200})
+          image (javax.imageio.ImageIO/read (io/file out))]
+      (is (= "ok" (:status result)))
+      (is (number? (get-in result [:timings :png])))
+      (is (= [200 200] [(.getWidth image) (.getHeight image)])))))
+
+(deftest render-job-isolates-errors
+  (testing "a broken job reports an error without stopping the server"
+    (let [out (temp-path ".svg")
+          bad (binding [*out* (java.io.StringWriter.)]
+                (cli/render-job sci-ctx {:id 2 :code "(no-such-fn 1 2)" :output out}))
+          good (cli/render-job sci-ctx {:id 3 :code "(poly 4 0.5 0 0 {})" :output out})]
+      (is (= "error" (:status bad)))
+      (is (= "ok" (:status good)))))
+
+  (testing "a pattern found invalid while it's being written leaves no output file"
+    (let [out (temp-path ".svg")
+          code (str "(assoc-in (vec (for [i (range 5)] {:style {:stroke [0 0 0]} "
+                    ":points (vec (for [j (range 100)] [(/ i 10.0) (/ j 100.0)]))})) "
+                    "[2 :points 37] [:x 1])")]
+      (io/delete-file out)
+      (let [result (binding [*out* (java.io.StringWriter.)]
+                     (cli/render-job sci-ctx {:id 9 :code code :output out :validate "fast"}))]
+        (is (= "error" (:status result)))
+        (is (= "invalid-pattern" (get-in result [:failure :kind])))
+        (is (not (.exists (io/file out))))))
+
+  (testing "the fast check leaves the sshapes to be checked as they're rendered"
+    (let [walked (atom 0)
+          pattern (map (fn [i] (swap! walked inc) {:style {} :points [[i i]]}) (range 10))]
+      (is (cli/validate-pattern :fast pattern))
+      (is (zero? @walked))
+      (is (not (binding [*out* (java.io.StringWriter.)] (cli/validate-pattern :fast {:style {}})))))))
+
+  (testing "definitions in one job don't leak into the next"
+    (let [out (temp-path ".svg")
+          first-job (cli/render-job sci-ctx {:id 4 :code "(def leaky (poly 3 0.5 0 0 {})) leaky" :output out})
+          second-job (binding [*out* (java.io.StringWriter.)]
+                       (cli/render-job sci-ctx {:id 5 :code "leaky" :output out}))]
+      (is (= "ok" (:status first-job)))
+      (is (= "error" (:status second-job))))))
+
+(deftest structured-errors
+  (testing "a failing pattern is evaluated once and described on stderr"
+    (let [out (temp-path ".svg")
+          err (java.io.StringWriter.)
+          evaluations (atom 0)
+          result (binding [*err* err]
+                   (with-redefs [dynamic/evaluate-pattern (fn [ctx code]
+                                                            (swap! evaluations inc)
+                                                            (sci.core/eval-string code ctx))]
+                     (cli/render-job sci-ctx {:id 8 :code "(poly 4 0.5 0 0 {})\n(no-such-fn 1 2)" :output out})))
+          failure (:failure result)]
+      (is (= "error" (:status result)))
+      (is (= 1 @evaluations))
+      (is (= "unresolved-symbol" (:kind failure)))
+      (is (= "no-such-fn" (:symbol failure)))
+      (is (= "eval" (:phase failure)))
+      (is (= 2 (get-in failure [:location :line])))
+      (is (.contains (str err) "PATTERN-ERROR"))))
+
+  (testing "a nil result is an error too"
+    (let [result (binding [*err* (java.io.StringWriter.)]
+                   (cli/render-job sci-ctx {:id 9 :code "nil" :output (temp-path ".svg")}))]
+      (is (= "nil-result" (get-in result [:failure :kind]))))))
+
+(deftest batch-job-parsing
+  (testing "job lines may be JSON or EDN"
+    (is (= {:code "(square)" :output "a.svg"}
+           (cli/parse-job-line "{\"code\": \"(square)\", \"output\": \"a.svg\"}")))
+    (is (= {:code "(square)" :output "a.svg"}
+           (cli/parse-job-line "{:code \"(square)\" :output \"a.svg\"}"))))
+
+  (testing "size can be a number, a pair, or width and height"
+    (is (= [200 200] (cli/job-size {:size 200})))
+    (is (= [300 100] (cli/job-size {:size [300 100]})))
+    (is (= [640 480] (cli/job-size {:width 640 :height 480})))
+    (is (= [800 800] (cli/job-size {})))))
+
+(deftest saved-patterns
+  (testing "a saved pattern reads back with the same styles and points"
+    (let [path (temp-path ".ptrn")
+          pattern (cli/read-pattern-code sci-ctx "(poly 5 0.5 0 0 {:stroke (p-color 255 0 0)})" "test")]
+      (store/save-pattern path pattern)
+      (let [loaded (store/load-pattern path)]
+        (is (= (map :style pattern) (map :style loaded)))
+        (is (= (map (comp vec :points) pattern) (map (comp vec :points) loaded))))))
+
+  (testing "a job rendered from the pattern store isn't evaluated again"
+    (let [cache (.getPath (doto (java.io.File/createTempFile "patterning-cli-test" "")
+                            (.delete)))
+          out (temp-path ".svg")
+          job {:code "(poly 6 0.5 0 0 {:stroke (p-color 0 0 255)})" :output out :pattern-cache cache}
+          first-run (cli/render-job sci-ctx (assoc job :id 6))
+          second-run (cli/render-job sci-ctx (assoc job :id 7))]
+      (is (= "ok" (:status first-run) (:status second-run)))
+      (is (false? (:cached first-run)))
+      (is (true? (:cached second-run)))
+      (is (nil? (get-in second-run [:timings :eval])))
+      (is (.startsWith (slurp out) "<svg"))))
+
+  (testing "pruning keeps the most recently used entries that fit"
+    (let [cache (.getPath (doto (java.io.File/createTempFile "patterning-cli-test" "")
+                            (.delete)))
+          codes (map #(str "(poly " % " 0.5 0 0 {})") [3 4 5])
+          entry (fn [code] (let [k (store/pattern-key code)] (io/file cache (subs k 0 2) (str k ".ptrn"))))]
+      (doseq [[i code] (map-indexed vector codes)]
+        (store/store! cache code (cli/read-pattern-code sci-ctx code "test"))
+        (.setLastModified (entry code) (+ 1000000 (* i 1000))))
+      (is (= 1 (store/prune! cache (reduce + (map #(.length (entry %)) (rest codes))))))
+      (is (nil? (store/lookup cache (first codes))))
+      (is (some? (store/lookup cache (last codes)))))))
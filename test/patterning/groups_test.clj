@@ -170,3 +170,99 @@
       (is (thrown? clojure.lang.ExceptionInfo 
                    (groups/rotate-tile-set [p1 3])))) ; Invalid rotation count
     ))
+
+(deftest instances
+  (let [tile (groups/APattern (sshapes/->SShape {} [[0 0] [1 0] [1 1]]))]
+    (testing "a plain pattern has no instances"
+      (is (nil? (groups/instances tile)))
+      (is (= [{:tile tile :transform maths/identity-affine}] (groups/as-instances tile))))
+
+    (testing "transforms compose into the instance's affine"
+      (let [p (groups/translate 1 2 (groups/scale 0.5 tile))
+            [{t :tile m :transform}] (groups/instances p)]
+        (is (identical? tile t))
+        (is (every? true? (map mol= [0.5 0 0 0.5 1 2] m)))
+        (is (groups/mol= p (map (partial sshapes/affine-transform m) tile)))))
+
+    (testing "rotation matches rotate-point"
+      (let [m (:transform (first (groups/instances (groups/rotate maths/d90 tile))))]
+        (is (molp= (maths/rotate-point maths/d90 [1 0]) (maths/affine-point m [1 0])))))
+
+    (testing "concatenated patterns keep every copy, in order"
+      (let [p (groups/concat-patterns [(groups/translate 1 0 tile) tile (groups/h-reflect tile)])]
+        (is (= 9 (count (mapcat :points p))))
+        (is (= 3 (count (groups/instances p))))
+        (is (every? #(identical? tile (:tile %)) (groups/instances p)))))
+
+    (testing "chained transforms give the same points as transforming step by step"
+      (let [step (fn [p] (groups/rotate 0.3 (groups/translate 0.2 -0.1 (groups/scale 0.9 p))))
+            deep (nth (iterate step tile) 10)
+            by-hand (nth (iterate (fn [p] (map #(->> % (sshapes/scale 0.9) (sshapes/translate 0.2 -0.1) (sshapes/rotate 0.3)) p))
+                                  tile) 10)]
+        (is (= 1 (count (groups/instances deep))))
+        (is (groups/mol= deep by-hand))))))
+
+(deftest bounds
+  (let [tile (groups/APattern (sshapes/->SShape {} [[0 0] [1 0] [1 1]])
+                              (sshapes/->SShape {} [[-1 0.5] [0 2]]))
+        scan (fn [pattern] (let [ps (mapcat :points pattern)]
+                             [(apply min (map first ps)) (apply min (map second ps))
+                              (apply max (map first ps)) (apply max (map second ps))]))]
+    (testing "a pattern's bounds match a scan of its points, however it was made"
+      (is (= [-1 0 1 2] (groups/bounds tile)))
+      (doseq [p [(groups/translate 1 2 (groups/scale 0.5 tile))
+                 (groups/h-reflect (groups/stretch 2 3 tile))
+                 (groups/rotate 0.7 tile)
+                 (groups/concat-patterns [(groups/translate 3 0 tile) (groups/rotate 2 tile)])]]
+        (is (every? true? (map mol= (scan p) (groups/bounds p))))))
+
+    (testing "reframe fills the viewport"
+      (let [[x1 y1 x2 y2] (groups/bounds (groups/reframe (groups/scale 7 tile)))]
+        (is (mol= -1 x1))
+        (is (mol= -1 y1))
+        (is (mol= 1 (max x2 y2)))))))
+
+(deftest spatial-index
+  (let [squares (for [x (range -1 1 0.25) y (range -1 1 0.25)]
+                  (sshapes/->SShape {} [[x y] [(+ x 0.1) y] [(+ x 0.1) (+ y 0.1)]]))
+        index (groups/spatial-index squares)
+        box [-0.3 0.1 0.2 0.45]]
+    (testing "a query finds the same sshapes as a scan, in the same order"
+      (is (= (filter #(sshapes/boxes-meet? box (sshapes/bounds %)) squares)
+             (groups/index-query index box)))
+      (is (empty? (groups/index-query index [5 5 6 6]))))
+
+    (testing "hit-testing a point"
+      (is (= 1 (count (groups/index-at index [0.05 0.05]))))
+      (is (empty? (groups/index-at index [0.2 0.2])))))
+
+  (testing "a pattern with no width can be queried from far away"
+    (let [lines (for [y (range -1 1 0.25)] (sshapes/->SShape {} [[0.5 y] [0.5 (+ y 0.2)]]))
+          index (groups/spatial-index lines)]
+      (is (= lines (groups/index-query index [-1 -1 1 1])))
+      (is (= 1 (count (groups/index-query index [-1 0.05 1 0.1])))))))
+
+(deftest quick-and-checked-validation
+  (let [good (vec (for [i (range 5)] (sshapes/->SShape {:stroke [0 0 0]} (vec (for [j (range 100)] [i j])))))
+        bad-point (assoc-in good [2 :points 37] [:x 1])
+        bad-style (assoc-in good [3 :style] "red")]
+    (testing "the quick check agrees on good patterns and broken structure"
+      (is (groups/quick-validate-group good))
+      (is (groups/quick-validate-group (groups/pack good)))
+      (is (not (groups/quick-validate-group bad-style)))
+      (is (not (groups/quick-validate-group [{:style {}}]))))
+
+    (testing "a bad point the sample misses is caught as the pattern is consumed"
+      (is (groups/quick-validate-group bad-point))
+      (is (= (count good) (count (groups/checked-pattern good))))
+      (let [e (try (doall (groups/checked-pattern bad-point)) nil
+                   (catch clojure.lang.ExceptionInfo e e))]
+        (is (= 2 (:index (ex-data e))))
+        (is (contains? (:explanation (ex-data e)) :points))))
+
+    (testing "checking keeps the instances, with their tiles still shared"
+      (let [tile (groups/APattern (sshapes/->SShape {} [[0 0] [1 1]]))
+            checked (groups/checked-pattern (groups/concat-patterns [tile (groups/translate 1 0 tile)]))
+            [a b] (groups/instances checked)]
+        (is (identical? (:tile a) (:tile b)))
+        (is (= 2 (count checked)))))))
@@ -82,3 +82,26 @@
         )
 
     ))
+
+(deftest l-system-streams
+  (let [rules [["F" "F[+F]F[-F]Y[F]"] ["Y" "Z"]]
+        rewritten (fn [steps seed] (last (take (inc steps) (iterate #(l-systems/apply-rules rules %) seed))))]
+    (testing "the expansion is the string rewritten generation by generation"
+      (doseq [steps [0 1 2 5]]
+        (is (= (rewritten steps "F") (str (l-systems/expand steps rules "F"))))
+        (is (= (rewritten steps "F") (l-systems/multi-apply-rules steps rules "F")))))
+
+    (testing "it reduces without building the string, and stops early"
+      (is (= (count (rewritten 5 "F"))
+             (reduce (fn [n _] (inc n)) 0 (l-systems/expand 5 rules "F"))))
+      (is (= 3 (reduce (fn [n _] (if (= n 2) (reduced 3) (inc n))) 0 (l-systems/expand 9 rules "F")))))
+
+    (testing "the turtle draws a stream as it draws the string"
+      (let [leaf {\Z (fn [x y a] [(sshapes/->SShape {} [[x y]])])}
+            from-string (turtle/basic-turtle [0 1] 0.1 0 0.3 (rewritten 4 "F") leaf {})
+            from-stream (turtle/basic-turtle [0 1] 0.1 0 0.3 ((l-systems/l-system-stream rules) 4 "F") leaf {})
+            recursive (second (turtle/l-string-turtle-to-group-r [0 1] 0.1 0 0.3 (rewritten 4 "F") leaf {}))]
+        (is (= from-string from-stream))
+        (is (= (count recursive) (count from-stream)))
+        (is (every? true? (map (fn [s1 s2] (every? true? (map molp= (:points s1) (:points s2))))
+                               recursive from-stream)))))))
@@ -0,0 +1,43 @@
+(ns patterning.raster-test
+  (:require [clojure.test :refer :all]
+            [patterning.raster :as raster]
+            [patterning.color :refer [p-color]]
+            [patterning.sshapes :refer [->SShape]]
+            [patterning.sshapes :as sshapes])
+  (:import [java.awt.image BufferedImage]
+           [javax.imageio ImageIO]))
+
+(defn argb [^BufferedImage image x y]
+  (let [c (.getRGB image x y)]
+    [(bit-and (bit-shift-right c 16) 255) (bit-and (bit-shift-right c 8) 255)
+     (bit-and c 255) (bit-and (unsigned-bit-shift-right c 24) 255)]))
+
+(deftest render-image
+  (testing "fills and strokes are drawn in their p-colors, on a transparent background"
+    (let [square (->SShape {:stroke (p-color 255 0 0) :stroke-weight 4 :fill (p-color 0 0 255)}
+                           [[-0.5 -0.5] [0.5 -0.5] [0.5 0.5] [-0.5 0.5] [-0.5 -0.5]])
+          image (raster/render-image 100 100 [square])]
+      (is (= 100 (.getWidth image) (.getHeight image)))
+      (is (= [0 0 255 255] (argb image 50 50)))
+      (is (= [255 0 0 255] (argb image 25 50)))
+      (is (zero? (last (argb image 5 5))))))
+
+  (testing "a background color, translucent colors and packed points"
+    (let [line (->SShape {:stroke (p-color 0 0 0 128) :stroke-weight 10}
+                         (sshapes/pack-points [[-1 0] [1 0]]))
+          image (raster/render-image [-1 -1 1 1] [0 0 50 50] 50 50 {:background (p-color 255)} [line])]
+      (is (= [255 255 255 255] (argb image 25 5)))
+      (is (< 120 (first (argb image 25 25)) 135))))
+
+  (testing "bezier sshapes follow their control points"
+    (let [arch (sshapes/s-bez-curve {:stroke-weight 2} [[-1 0.5] [-1 -1] [1 -1] [1 0.5]])
+          image (raster/render-image 100 100 [arch])]
+      ;; the curve peaks at y = 18.75, well away from its control points
+      (is (< 200 (last (argb image 50 18))))
+      (is (zero? (last (argb image 2 2)))))))
+
+(deftest write-png
+  (testing "the PNG reads back at the output size"
+    (let [image (ImageIO/read (java.io.ByteArrayInputStream.
+                               (raster/make-png 64 32 [(->SShape {} [[-1 -1] [1 1]])])))]
+      (is (= [64 32] [(.getWidth image) (.getHeight image)])))))
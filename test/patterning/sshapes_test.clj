@@ -147,3 +147,54 @@
       (is (<= (count triangles) 2))
       (is (every? #(maths/contains-point % [0.5 0.5]) triangles))))
   (println "Finished triangle-functions-test"))
+
+(deftest packed-points
+  (let [points [[0.0 0.0] [1.0 0.5] [-1.0 2.0]]
+        packed (sshapes/pack-points points)]
+    (testing "packed points behave like a vector of points"
+      (is (sshapes/packed-points? packed))
+      (is (= 3 (count packed)))
+      (is (= [1.0 0.5] (nth packed 1)))
+      (is (= points packed))
+      (is (= packed points))
+      (is (= (hash points) (hash packed)))
+      (is (= [[0.0 0.0] [1.0 0.5] [-1.0 2.0] [0.0 0.0]] (sshapes/close-shape packed)))
+      (is (= [] (sshapes/pack-points [])))
+      (is (mol= 2.0 (sshapes/bottom (->SShape {} packed)))))
+
+    (testing "transforms keep points packed"
+      (let [ss (sshapes/pack (->SShape {} points))
+            moved (first (groups/rotate maths/d90 (groups/translate 1 1 [ss])))]
+        (is (sshapes/packed-points? (:points moved)))
+        (is (sshapes/mol= moved (sshapes/rotate maths/d90 (sshapes/translate 1 1 (->SShape {} points)))))))
+
+    (testing "packed sshapes are valid groups"
+      (is (groups/validate-group (groups/pack [(->SShape {} points)]))))))
+
+(deftest simplification
+  (testing "Douglas-Peucker keeps the ends and the corners"
+    (let [line (concat (for [i (range 11)] [(/ i 10.0) (* 0.001 (mod i 2))])
+                       [[1.0 1.0]])]
+      (is (= [[0.0 0.0] [1.0 0.0] [1.0 1.0]] (sshapes/simplify-points 0.01 line)))
+      (is (= (vec line) (sshapes/simplify-points 0.0001 line)))
+      (is (= [[0 0] [1 1]] (sshapes/simplify-points 0.1 [[0 0] [1 1]])))))
+
+  (testing "bounds"
+    (is (= [-1 0 2 3] (sshapes/bounds (->SShape {} [[0 0] [2 1] [-1 3]]))))
+    (is (nil? (sshapes/bounds (->SShape {} [])))))
+
+  (testing "clip-to-box keeps the segments that may cross the box"
+    (is (= [[[-2 0] [0 0] [2 0]]]
+           (sshapes/clip-to-box [-1 -1 1 1] [[-3 5] [-2 0] [0 0] [2 0] [3 5]])))
+    (is (= [] (sshapes/clip-to-box [-1 -1 1 1] [[2 2] [3 3]]))))
+
+  (testing "packed points stay packed, with the same points kept"
+    (let [line (for [i (range 11)] [(/ i 10.0) (* 0.001 (mod i 2))])
+          packed (sshapes/pack-points line)
+          simplified (sshapes/simplify-points 0.01 packed)
+          runs (sshapes/clip-to-box [0.25 -1 0.55 1] packed)]
+      (is (sshapes/packed-points? simplified))
+      (is (= (sshapes/simplify-points 0.01 line) simplified))
+      (is (every? sshapes/packed-points? runs))
+      (is (= (sshapes/clip-to-box [0.25 -1 0.55 1] line) runs))
+      (is (= (sshapes/bounds (->SShape {} line)) (sshapes/bounds (->SShape {} packed)))))))
@@ -0,0 +1,89 @@
+(ns patterning.view-test
+  (:require [clojure.test :refer :all]
+            [patterning.view :as view]
+            [patterning.color :refer [p-color]]
+            [patterning.sshapes :refer [->SShape]]
+            [patterning.sshapes :as sshapes]
+            [patterning.groups :as groups]
+            [patterning.layouts :as layouts]))
+
+(def shapes
+  [(->SShape {:stroke (p-color 255 0 0) :stroke-weight 2} [[-1 -1] [0 0.5] [0.25 -0.75]])
+   (sshapes/s-bez-curve {:fill (p-color 0 0 255)} [[-0.5 0] [0 0.5] [0.5 0] [0 -0.5]])
+   (->SShape {} [])])
+
+(deftest streaming-svg
+  (testing "the streaming writer gives the same document as the string template"
+    (let [txpt (view/make-txpt [-1 -1 1 1] [0 0 400 300])]
+      (is (= (view/xml-tpl txpt 400 300 shapes)
+             (view/make-svg 400 300 shapes)))))
+
+  (testing "write-svg writes to any java.io.Writer"
+    (let [w (java.io.StringWriter.)]
+      (view/write-svg w 100 100 [(first shapes)])
+      (is (.startsWith (str w) "<svg"))
+      (is (.endsWith (str w) "</svg>"))
+      (is (re-find #"d='M 0\.0 0\.0 L 50\.0 75\.0 L 62\.5 12\.5'" (str w))))))
+
+(deftest instanced-svg
+  (testing "a grid of one tile draws the tile once and uses it n*n times"
+    (let [tile [(first shapes)]
+          svg (view/make-instanced-svg 400 400 (layouts/grid 3 tile))]
+      (is (= 1 (count (re-seq #"<g id=" svg))))
+      (is (= 1 (count (re-seq #"<path" svg))))
+      (is (= 9 (count (re-seq #"<use xlink:href=\"#tile-0\"" svg))))
+      (is (re-find #"vector-effect='non-scaling-stroke'" svg))))
+
+  (testing "tiles used once are drawn inline"
+    (let [svg (view/make-instanced-svg 400 400 (layouts/stack [(first shapes)] [(second shapes)]))]
+      (is (not (re-find #"<use" svg)))
+      (is (= 2 (count (re-seq #"<path" svg))))))
+
+  (testing "groups without instances are written as by make-svg"
+    (is (= (view/make-svg 400 300 shapes) (view/make-instanced-svg 400 300 shapes)))))
+
+(deftest optimize-for-window
+  (let [wiggle (->SShape {} (vec (for [i (range 1001)] [(- (/ i 500.0) 1) (* 0.0001 (mod i 2))])))
+        outside (->SShape {:fill (p-color 0)} [[2 2] [3 2] [3 3]])
+        curve (second shapes)
+        optimized (view/optimize-for-window [-1 -1 1 1] [0 0 200 200] [wiggle outside curve])]
+    (testing "shapes outside the viewport are dropped, and curves kept as they are"
+      (is (= 2 (count optimized)))
+      (is (= curve (second optimized))))
+    (testing "sub-pixel detail is simplified away"
+      (is (= 2 (count (:points (first optimized))))))
+    (testing "at poster size the detail is still sub-pixel, at a big enough size it isn't"
+      (is (< 2 (count (:points (first (view/optimize-for-window [-1 -1 1 1] [0 0 100000 100000] [wiggle])))))))
+    (testing "a pattern of instances keeps them, with copies out of view dropped and the tile simplified once"
+      (let [grid (groups/translate 1 0 (layouts/grid 3 [wiggle]))
+            optimized (view/optimize-for-window [-1 -1 1 1] [0 0 200 200] grid)
+            svg (view/make-instanced-svg 200 200 optimized)]
+        (is (= 6 (count (groups/instances optimized))))
+        (is (every? #(= 2 (count (:points %))) optimized))
+        (is (= 1 (count (re-seq #"<path" svg))))
+        (is (= 6 (count (re-seq #"<use xlink:href=\"#tile-0\"" svg))))))))
+
+(deftest compact-svg
+  (testing "rounded relative paths with the styles as classes"
+    (is (= (str "<svg xmlns=\"http://www.w3.org/2000/svg\" height=\"100\" width=\"100\"><style>"
+                ".s0{stroke:rgb(255,0,0);stroke-width:2px;fill:none}"
+                ".s1{stroke:rgb(0,0,0);fill:rgb(0,0,255)}</style>"
+                "\n<path class=\"s0\" d=\"M0 0l50 75 12.5-62.5\"/>"
+                "\n<path class=\"s1\" d=\"M25 50c25 25 50 0 25-25\"/></svg>")
+           (view/make-compact-svg 100 100 shapes))))
+
+  (testing "unfilled sshapes with the same style share a path"
+    (let [lines [(->SShape {:stroke (p-color 0)} [[-1 -1] [0 0]])
+                 (->SShape {:stroke (p-color 0)} [[0 0.5] [1 1]])]
+          svg (view/make-compact-svg 100 100 lines)]
+      (is (= 1 (count (re-seq #"<path" svg))))
+      (is (.contains svg "d=\"M0 0l50 50m0 25l50 25\""))))
+
+  (testing "precision sets the digits kept"
+    (let [line [(->SShape {} [[0 0] [0.0123 0]])]
+          compact (fn [opts] (let [w (java.io.StringWriter.)]
+                               (view/write-compact-svg w [-1 -1 1 1] [0 0 100 100] 100 100 opts line)
+                               (str w)))]
+      (is (.contains (compact {}) "d=\"M50 50l0.6 0\""))
+      (is (.contains (compact {:precision 3}) "d=\"M50 50l0.615 0\""))
+      (is (.contains (compact {:precision 0}) "d=\"M50 50l1 0\"")))))
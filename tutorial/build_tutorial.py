@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+
+"""Build every page of the tutorial in one go.
+
+All the pattern blocks from all the pages are gathered up front and rendered
+across a pool of workers, each with its own warm render server. A page is
+assembled and written as soon as the last of its blocks has finished. Pattern
+ids are assigned per page in page order (see split_page_blocks), so SVG file
+names don't depend on the order in which the renders complete.
+
+Builds are incremental. A manifest in the output directory records, for every
+page, the hash of its markdown and the key of each of its SVGs (pattern code,
+size and library fingerprint), along with the hash of the page template. The
+next build only re-renders blocks whose key changed, only rewrites pages
+whose markdown or template changed, and deletes SVGs and pages that no longer
+have a source.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import generate_pattern_page as gpp
+import build_timing
+
+MANIFEST_NAME = '.build-manifest.json'
+MANIFEST_VERSION = 1
+
+
+def read_page(markdown_file, out_dir):
+    """Read and split one markdown page, ready to be planned, rendered and assembled."""
+    name = os.path.basename(markdown_file)
+    output_file = os.path.join(out_dir, os.path.splitext(name)[0] + '.html')
+    with open(markdown_file, 'r') as f:
+        content = f.read()
+    main_open, main_close, cards = gpp.split_page_blocks(content)
+    return {
+        'markdown_file': markdown_file,
+        'markdown_hash': text_hash(content),
+        'output_file': output_file,
+        'title': gpp.page_title(content),
+        'page_name': gpp.page_name_for(output_file),
+        'main_open': main_open,
+        'main_close': main_close,
+        'cards': cards,
+        'pending': {card['id'] for card in cards if card['kind'] == 'pattern'},
+        'svg_paths': {},
+        'svg_keys': {},
+        'render_seconds': 0.0,
+        'up_to_date': False,
+    }
+
+
+def source_files(sources_dir):
+    """The markdown pages in sources_dir, in file name order."""
+    return [os.path.join(sources_dir, name) for name in sorted(os.listdir(sources_dir))
+            if name.endswith('.md')]
+
+
+def collect_pages(sources_dir, out_dir):
+    """Read and split every markdown page in sources_dir, in file name order."""
+    return [read_page(markdown_file, out_dir) for markdown_file in source_files(sources_dir)]
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def svg_name(page, card):
+    return f"{page['page_name']}-pattern-{card['id']}.svg"
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if manifest.get('version') == MANIFEST_VERSION else {}
+
+
+def page_entry(page):
+    """The manifest record for a built page: its markdown hash and the keys of its rendered SVGs."""
+    svgs = {}
+    for card in page['cards']:
+        if card['kind'] == 'pattern' and page['svg_paths'].get(card['id']):
+            svgs[svg_name(page, card)] = page['svg_keys'][card['id']]
+    return {'markdown': page['markdown_hash'], 'svgs': svgs}
+
+
+def build_manifest(pages, template_hash):
+    return {'version': MANIFEST_VERSION,
+            'template': template_hash,
+            'pages': {os.path.basename(page['output_file']): page_entry(page) for page in pages}}
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def remove_page_outputs(out_dir, page_file, entry):
+    """Delete a page's HTML and the SVGs its manifest entry lists."""
+    print(f"Removing page with no source: {page_file}")
+    gpp.remove_file(os.path.join(out_dir, page_file))
+    for name in entry.get('svgs', {}):
+        gpp.remove_file(os.path.join(out_dir, name))
+
+
+def plan_incremental_build(pages, out_dir, manifest, template_hash, fingerprint, remove_missing=True):
+    """Work out what the last build left usable, using its manifest.
+
+    Blocks whose SVG is still on disk with an unchanged key are dropped from
+    each page's pending set, and a page is marked up_to_date when its HTML can
+    be kept as it is. SVGs left over from blocks that no longer exist are
+    deleted, and so are pages missing from `pages` when remove_missing is set.
+    """
+    same_template = manifest.get('template') == template_hash
+    old_pages = manifest.get('pages', {})
+    current_files = set()
+
+    for page in pages:
+        page_file = os.path.basename(page['output_file'])
+        current_files.add(page_file)
+        old = old_pages.get(page_file, {})
+        old_svgs = old.get('svgs', {})
+        names = set()
+        for card in page['cards']:
+            if card['kind'] != 'pattern':
+                continue
+            width, height = card['size']
+            key = gpp.pattern_key(fingerprint, card['code'], width, height)
+            name = svg_name(page, card)
+            path = os.path.join(out_dir, name)
+            names.add(name)
+            page['svg_keys'][card['id']] = key
+            if old_svgs.get(name) == key and os.path.exists(path):
+                page['svg_paths'][card['id']] = path
+                page['pending'].discard(card['id'])
+
+        page['up_to_date'] = (same_template
+                              and old.get('markdown') == page['markdown_hash']
+                              and not page['pending']
+                              and os.path.exists(page['output_file']))
+
+        for name in set(old_svgs) - names:
+            print(f"Removing orphaned SVG: {name}")
+            gpp.remove_file(os.path.join(out_dir, name))
+
+    if remove_missing:
+        for page_file, old in old_pages.items():
+            if page_file not in current_files:
+                remove_page_outputs(out_dir, page_file, old)
+
+
+def sync_tree(src, dest):
+    """Copy src into dest, skipping files whose size and modification time already match."""
+    copied = 0
+    for root, dirs, files in os.walk(src):
+        target_root = os.path.join(dest, os.path.relpath(root, src))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            source_path = os.path.join(root, name)
+            target_path = os.path.join(target_root, name)
+            source_stat = os.stat(source_path)
+            try:
+                target_stat = os.stat(target_path)
+                if (target_stat.st_size == source_stat.st_size
+                        and int(target_stat.st_mtime) == int(source_stat.st_mtime)):
+                    continue
+            except FileNotFoundError:
+                pass
+            with build_timing.phase('file-copy'):
+                shutil.copy2(source_path, target_path)
+            copied += 1
+    print(f"Synced {src} to {dest} ({copied} files copied)")
+
+
+def finish_page(page, out_dir):
+    started = time.perf_counter()
+    html_content, patterns, failed_patterns = gpp.assemble_page(
+        page['main_open'], page['main_close'], page['cards'], out_dir, page['page_name'], page['svg_paths'])
+    gpp.write_html_page(page['output_file'], page['title'], html_content, patterns, failed_patterns)
+    # A page's blocks render on several workers, so its time is the sum of
+    # theirs plus assembling and writing it
+    build_timing.add_item('page', os.path.basename(page['output_file']),
+                          page['render_seconds'] + time.perf_counter() - started)
+    print(f"Generated {page['output_file']} from {page['markdown_file']}")
+
+
+def batch_job(n, card, svg_path):
+    """The render job for a pattern block. It's rendered in gpp.SVG_FORMAT, the
+    format its cache and manifest keys are made for."""
+    return {'id': n, 'code': card['code'], 'output': os.path.abspath(svg_path),
+            'format': gpp.SVG_FORMAT, 'size': list(card['size'])}
+
+
+def render_in_batches(pages, out_dir, jobs, cache=None):
+    """Render every pattern block with `jobs` concurrent `patterning.cli --batch` processes.
+
+    Unlike the server path, a failing pattern doesn't halt the build; its page
+    just shows an error in place of the preview.
+    """
+    pending = []
+    for page in pages:
+        for card in page['cards']:
+            if card['kind'] != 'pattern' or card['id'] not in page['pending']:
+                continue
+            width, height = card['size']
+            svg_path = os.path.join(out_dir, f"{page['page_name']}-pattern-{card['id']}.svg")
+            key = cache.key(card['code'], width, height) if cache is not None else None
+            if cache is not None and cache.fetch(key, svg_path):
+                print(f"Cached SVG: {svg_path}")
+                page['svg_paths'][card['id']] = svg_path
+                page['pending'].discard(card['id'])
+                continue
+            gpp.remove_file(svg_path)
+            pending.append((page, card, svg_path, key))
+
+    chunks = [chunk for chunk in (pending[i::jobs] for i in range(jobs)) if chunk]
+
+    def run(chunk):
+        batch = [batch_job(n, card, svg_path) for n, (page, card, svg_path, key) in enumerate(chunk)]
+        return chunk, gpp.render_batch(batch)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(chunks))) as pool:
+        for chunk, results in pool.map(run, chunks):
+            for n, (page, card, svg_path, key) in enumerate(chunk):
+                result = results.get(n, {})
+                page['pending'].discard(card['id'])
+                seconds = sum((result.get('timings') or {}).values()) / 1000.0
+                build_timing.add_item('block', f"{page['page_name']}#{card['id']}", seconds)
+                page['render_seconds'] += seconds
+                if result.get('status') == 'ok':
+                    page['svg_paths'][card['id']] = svg_path
+                    if cache is not None:
+                        cache.store(key, svg_path)
+                else:
+                    print(f"Error generating SVG {svg_path}: {result.get('error', 'no result from renderer')}")
+
+
+def build_tutorial(sources_dir, out_dir, tutorial_root, jobs=None, use_server=True, cache=None, batch=False,
+                   force=False, halt_on_error=True):
+    """Render the changed pattern blocks of all pages on `jobs` workers and write the changed pages."""
+    jobs = jobs or os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+    pages = collect_pages(sources_dir, out_dir)
+
+    template_hash = text_hash(gpp.HTML_TEMPLATE)
+    fingerprint = cache.fingerprint if cache is not None else gpp.library_fingerprint()
+    manifest = {} if force else load_manifest(out_dir)
+    plan_incremental_build(pages, out_dir, manifest, template_hash, fingerprint)
+    skipped = sum(1 for page in pages if page['up_to_date'])
+    if skipped:
+        print(f"{skipped} of {len(pages)} pages are up to date")
+
+    if batch:
+        try:
+            render_in_batches(pages, out_dir, jobs, cache)
+        finally:
+            if cache is not None:
+                cache.prune()
+        for page in pages:
+            if not page['up_to_date']:
+                finish_page(page, out_dir)
+        save_manifest(out_dir, build_manifest(pages, template_hash))
+        return
+
+    # One render server per worker thread, started on first use
+    local = threading.local()
+    servers = []
+    servers_lock = threading.Lock()
+
+    def worker_renderer():
+        if not use_server:
+            return None
+        renderer = getattr(local, 'renderer', None)
+        if renderer is None:
+            renderer = gpp.RenderServer()
+            local.renderer = renderer
+            with servers_lock:
+                servers.append(renderer)
+        return renderer
+
+    def render(page, card):
+        width, height = card['size']
+        started = time.perf_counter()
+        svg_path = gpp.generate_svg(card['code'], card['id'], out_dir, page['page_name'],
+                                    width, height, worker_renderer(), cache, halt_on_error)
+        return svg_path, time.perf_counter() - started
+
+    print(f"Rendering {sum(len(page['pending']) for page in pages)} patterns "
+          f"from {len(pages)} pages on {jobs} workers")
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    futures = {}
+    try:
+        for page in pages:
+            for card in page['cards']:
+                if card['kind'] == 'pattern' and card['id'] in page['pending']:
+                    futures[pool.submit(render, page, card)] = (page, card)
+
+        for page in pages:
+            if not page['pending'] and not page['up_to_date']:
+                finish_page(page, out_dir)
+
+        for future in as_completed(futures):
+            page, card = futures[future]
+            page['svg_paths'][card['id']], seconds = future.result()
+            page['render_seconds'] += seconds
+            page['pending'].discard(card['id'])
+            if not page['pending']:
+                finish_page(page, out_dir)
+        save_manifest(out_dir, build_manifest(pages, template_hash))
+    except BaseException:
+        # A failed render halts the build, so don't start the rest
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        pool.shutdown(wait=True)
+        for renderer in servers:
+            renderer.close()
+        if cache is not None:
+            cache.prune()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build all tutorial pages, rendering patterns in parallel')
+    parser.add_argument('sources_dir', help='Directory of tutorial markdown files')
+    parser.add_argument('out_dir', help='Output directory for HTML pages and SVGs')
+    parser.add_argument('tutorial_root', help='Tutorial root path for SVG references')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Number of patterns to render at once (default: number of CPUs)')
+    parser.add_argument('--no-server', action='store_true',
+                        help='Start a fresh `lein run` for every pattern instead of one warm server per worker')
+    parser.add_argument('--batch', action='store_true',
+                        help='Render with one `patterning.cli --batch` call per worker instead of render servers')
+    parser.add_argument('--force', action='store_true',
+                        help='Ignore the build manifest and rebuild every page and pattern')
+    parser.add_argument('--sync', action='append', default=[], metavar='DIR',
+                        help='Copy DIR into the output directory, skipping unchanged files (may be repeated)')
+    parser.add_argument('--watch', action='store_true',
+                        help='After building, rebuild pages as they are saved and serve a live-reloading preview')
+    parser.add_argument('--port', type=int, default=8000, help='Port for the --watch preview server')
+    parser.add_argument('--no-cache', action='store_true', help='Re-render every pattern, ignoring the SVG cache')
+    parser.add_argument('--cache-dir', default=gpp.DEFAULT_CACHE_DIR, help='Directory for cached SVGs')
+    parser.add_argument('--cache-max-mb', type=int, default=gpp.DEFAULT_CACHE_MAX_MB,
+                        help='Evict least recently used SVGs once the cache grows past this size')
+    build_timing.add_arguments(parser)
+    args = parser.parse_args()
+    build_timing.start('tutorial')
+
+    for src in args.sync:
+        sync_tree(src, os.path.join(args.out_dir, os.path.basename(os.path.normpath(src))))
+
+    cache = None if args.no_cache else gpp.SvgCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+    if args.watch:
+        from watch_tutorial import watch_tutorial
+        watch_tutorial(args.sources_dir, args.out_dir, args.tutorial_root, port=args.port, cache=cache,
+                       jobs=args.jobs)
+        return
+    build_tutorial(args.sources_dir, args.out_dir, args.tutorial_root,
+                   jobs=args.jobs, use_server=not args.no_server, cache=cache, batch=args.batch, force=args.force)
+    if args.timings is not None:
+        build_timing.finish(args.timings)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,31 @@
 #!/usr/bin/env python3
 
 import re
+import json
+import hashlib
 import markdown
 import os
+import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 from jinja2 import Template
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import build_timing
+from source_fingerprint import source_fingerprint
+
+# Patterning library sources; any change here invalidates every cached SVG
+LIBRARY_DIR = os.path.join('src', 'cljc', 'patterning')
+DEFAULT_CACHE_DIR = os.path.join('tutorial', '.svg-cache')
+DEFAULT_CACHE_MAX_MB = 256
+# Evaluated patterns kept by the render JVM (`patterning.cli --pattern-cache`),
+# so a pattern whose SVG is rebuilt at another size isn't evaluated again
+PATTERN_CACHE_DIR = os.path.join('tutorial', '.pattern-cache')
+# Pages are served, so their SVGs use the cli's compact output
+SVG_FORMAT = 'svg-compact'
+
 # Template for the HTML page
 HTML_TEMPLATE = """<!DOCTYPE html>
 <html lang="en">
@@ -170,8 +188,216 @@ def split_outer_main(content):
 
 def markdown_to_html(markdown_text):
     """Convert one markdown card to HTML in isolation."""
-    md = markdown.Markdown(extensions=['extra', 'md_in_html'])
-    return md.convert(markdown_text)
+    with build_timing.phase('markdown-to-html'):
+        md = markdown.Markdown(extensions=['extra', 'md_in_html'])
+        return md.convert(markdown_text)
+
+class RenderServer:
+    """A warm `patterning.cli --server` process that renders many patterns.
+
+    Starting the JVM and building the SCI context happens once; each pattern is
+    then a single JSON line to the server's stdin and a JSON result line back.
+    """
+
+    def __init__(self, cwd='.'):
+        self.cwd = cwd
+        self.proc = None
+        self.next_id = 0
+
+    def start(self):
+        cmd = ['lein', 'run', '-m', 'patterning.cli', '--pattern-cache', PATTERN_CACHE_DIR, '--server']
+        print(f"Starting render server: {' '.join(cmd)}")
+        # stderr is left attached to ours so diagnostics show up without
+        # us having to drain a second pipe.
+        with build_timing.phase('subprocess-spawn'):
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         text=True, bufsize=1, cwd=self.cwd)
+            self._read_response(None)
+
+    def render(self, pattern_code, svg_path, width, height):
+        """Render one pattern and return the server's result record."""
+        if self.proc is None or self.proc.poll() is not None:
+            self.start()
+        self.next_id += 1
+        job = {'id': self.next_id, 'code': pattern_code, 'output': os.path.abspath(svg_path),
+               'format': SVG_FORMAT, 'width': width, 'height': height}
+        with build_timing.phase('render-request'):
+            self.proc.stdin.write(json.dumps(job) + '\n')
+            self.proc.stdin.flush()
+            result = self._read_response(self.next_id)
+        build_timing.record_jvm_timings(result.get('timings'))
+        return result
+
+    def _read_response(self, job_id):
+        # Leiningen may print its own chatter (eg. AOT compilation) before the
+        # server starts, so anything that isn't a JSON object is passed through.
+        for line in self.proc.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                print(line, end='')
+                continue
+            if not isinstance(message, dict):
+                continue
+            if job_id is None and message.get('status') == 'ready':
+                return message
+            if job_id is not None and message.get('id') == job_id:
+                return message
+        raise RuntimeError("Render server exited unexpectedly")
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdin.close()
+            self.proc.wait()
+            self.proc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def library_fingerprint(library_dir=LIBRARY_DIR):
+    """Hash every file under the Patterning library sources, paths included."""
+    return source_fingerprint([library_dir], library_dir)
+
+def pattern_key(fingerprint, pattern_code, width, height, svg_format=SVG_FORMAT):
+    """Hash of everything that determines a pattern's rendered SVG."""
+    digest = hashlib.sha256()
+    for part in (fingerprint, str(width), str(height), svg_format, pattern_code):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+class SvgCache:
+    """Content-addressed store of rendered SVGs.
+
+    Entries are keyed by the pattern code, the output size and a fingerprint of
+    the library sources, so an entry is only reused when rendering would give
+    the same file. Hits are hard-linked (or copied) into place. The cache is
+    kept under max_bytes by evicting the least recently used entries.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024,
+                 fingerprint=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.fingerprint = fingerprint if fingerprint is not None else library_fingerprint()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, pattern_code, width, height):
+        return pattern_key(self.fingerprint, pattern_code, width, height)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.svg')
+
+    def fetch(self, key, dest_path):
+        """Put the cached SVG for key at dest_path. Returns False on a miss."""
+        entry = self._entry_path(key)
+        if not os.path.exists(entry):
+            return False
+        with build_timing.phase('file-copy'):
+            remove_file(dest_path)
+            try:
+                os.link(entry, dest_path)
+            except OSError:
+                shutil.copy2(entry, dest_path)
+        # Record the use so eviction keeps recently needed entries
+        os.utime(entry)
+        return True
+
+    def store(self, key, svg_path):
+        entry = self._entry_path(key)
+        temp_path = f'{entry}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with build_timing.phase('file-copy'):
+            shutil.copy2(svg_path, temp_path)
+            os.replace(temp_path, entry)
+
+    def prune(self):
+        """Evict least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.svg'):
+                st = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.unlink(os.path.join(self.cache_dir, name))
+            total -= size
+
+def remove_file(path):
+    """Unlink path if it exists.
+
+    Outputs may be hard links into the SVG cache, so they must be unlinked
+    rather than overwritten in place before being rendered again.
+    """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def render_batch(jobs, cwd='.'):
+    """Render a list of job dicts with a single `patterning.cli --batch` process.
+
+    Jobs are written to the process's stdin one JSON object per line; the
+    result records are returned keyed by job id.
+    """
+    cmd = ['lein', 'run', '-m', 'patterning.cli', '--pattern-cache', PATTERN_CACHE_DIR, '--batch', '-']
+    print(f"Rendering {len(jobs)} patterns with: {' '.join(cmd)}")
+    stdin = ''.join(json.dumps(job) + '\n' for job in jobs)
+    # stderr carries the per-job diagnostics, so leave it attached to ours
+    with build_timing.phase('batch-render'):
+        result = subprocess.run(cmd, input=stdin, stdout=subprocess.PIPE, text=True, cwd=cwd)
+    results = {}
+    for line in result.stdout.splitlines():
+        try:
+            message = json.loads(line)
+        except ValueError:
+            print(line)
+            continue
+        if isinstance(message, dict) and 'id' in message:
+            results[message['id']] = message
+            build_timing.record_jvm_timings(message.get('timings'))
+    return results
+
+def describe_failure(result):
+    """One line for a failed render result: its structured failure when the
+    renderer sent one (kind, symbol and line), otherwise its error message."""
+    failure = result.get('failure')
+    if not failure:
+        return str(result.get('error'))
+    where = failure.get('location') or {}
+    parts = [failure.get('kind', 'error')]
+    if failure.get('symbol'):
+        parts.append(f"`{failure['symbol']}`")
+    if where.get('line'):
+        parts.append(f"at line {where['line']}")
+    if failure.get('phase'):
+        parts.append(f"during {failure['phase']}")
+    return f"{' '.join(parts)}: {failure.get('message', result.get('error'))}"
+
+def generate_svg_with_server(renderer, pattern_code, pattern_id, output_dir, page_name, width, height,
+                             halt_on_error=True):
+    """Generate SVG for a pattern through a warm RenderServer."""
+    svg_path = os.path.join(output_dir, f'{page_name}-pattern-{pattern_id}.svg')
+    try:
+        result = renderer.render(pattern_code, svg_path, width, height)
+    except Exception as e:
+        print(f"Error generating SVG for pattern {pattern_id}: {e}")
+        return None
+
+    if result.get('status') == 'ok':
+        print(f"Generated SVG: {svg_path}")
+        return svg_path
+    elif halt_on_error:
+        print(f"Error generating SVG for pattern {pattern_id}. Halting build.")
+        print(f"--- ERROR ---\n{describe_failure(result)}")
+        sys.exit(1)
+    else:
+        print(f"Error generating SVG for pattern {pattern_id}: {describe_failure(result)}")
+        return None
 
 def generate_svg_for_pattern(pattern_code, pattern_id, output_dir, page_name, width, height):
     """Generate SVG for a pattern using the Patterning CLI tool."""
@@ -188,22 +414,14 @@ def generate_svg_for_pattern(pattern_code, pattern_id, output_dir, page_name, wi
         # Since we're now running from the root, we can use current directory
         cwd = '.'
         
-        cmd = ['lein', 'run', '-m', 'patterning.cli', temp_file_path, svg_path, 'svg', str(width), str(height)]
-        print(f"DEBUG: Running command: {' '.join(cmd)}")
-        print(f"DEBUG: Working directory: {cwd}")
-        print(f"DEBUG: Target SVG path: {svg_path}")
-            
-        result = subprocess.run(cmd, capture_output=True, text=True, cwd=cwd)
-        
-        print(f"DEBUG: Command return code: {result.returncode}")
-        print(f"DEBUG: Command stdout: {result.stdout}")
-        print(f"DEBUG: Command stderr: {result.stderr}")
+        cmd = ['lein', 'run', '-m', 'patterning.cli', temp_file_path, svg_path, SVG_FORMAT, str(width), str(height)]
+
+        # A fresh JVM per pattern, so spawn, eval and SVG writing are all in here
+        with build_timing.phase('subprocess-run'):
+            result = subprocess.run(cmd, capture_output=True, text=True, cwd=cwd)
         
         if result.returncode == 0:
             print(f"Generated SVG: {svg_path}")
-            print(f"DEBUG: SVG file exists after generation: {os.path.exists(svg_path)}")
-            if os.path.exists(svg_path):
-                print(f"DEBUG: SVG file size: {os.path.getsize(svg_path)} bytes")
             return svg_path
         else:
             print(f"Error generating SVG for pattern {pattern_id}. Halting build.")
@@ -221,6 +439,33 @@ def generate_svg_for_pattern(pattern_code, pattern_id, output_dir, page_name, wi
         except:
             pass
 
+def generate_svg(pattern_code, pattern_id, output_dir, page_name, width, height, renderer=None, cache=None,
+                 halt_on_error=True):
+    """Generate the SVG for a pattern, from the cache if possible."""
+    with build_timing.item('block', f'{page_name}#{pattern_id}'):
+        return _generate_svg(pattern_code, pattern_id, output_dir, page_name, width, height, renderer, cache,
+                             halt_on_error)
+
+def _generate_svg(pattern_code, pattern_id, output_dir, page_name, width, height, renderer, cache, halt_on_error):
+    svg_path = os.path.join(output_dir, f'{page_name}-pattern-{pattern_id}.svg')
+    key = None
+    if cache is not None:
+        key = cache.key(pattern_code, width, height)
+        if cache.fetch(key, svg_path):
+            print(f"Cached SVG: {svg_path}")
+            return svg_path
+
+    remove_file(svg_path)
+    if renderer is not None:
+        svg_path = generate_svg_with_server(renderer, pattern_code, pattern_id, output_dir, page_name, width, height,
+                                            halt_on_error)
+    else:
+        svg_path = generate_svg_for_pattern(pattern_code, pattern_id, output_dir, page_name, width, height)
+
+    if cache is not None and svg_path and os.path.exists(svg_path):
+        cache.store(key, svg_path)
+    return svg_path
+
 def render_pattern_container(pattern, pattern_id, svg_rel_path, block_type, error_message=None):
     """Render the HTML container for a pattern block."""
     preview_content = (
@@ -262,46 +507,70 @@ def render_pattern_container(pattern, pattern_id, svg_rel_path, block_type, erro
     </div>
 </div>'''
 
-def process_blocks(content, output_dir, page_name, tutorial_root):
-    """Process content card-by-card so malformed HTML in one card does not affect others."""
+BLOCK_CONFIGS = {
+    ':patterning': {'size': (400, 400), 'store_code': True},
+    ':patterning-thumbnail': {'size': (200, 200), 'store_code': False},
+    ':patterning-small': {'size': (200, 200), 'store_code': True},
+}
+
+def split_page_blocks(content):
+    """Split a page into cards without rendering anything.
+
+    Returns (main_open, main_close, cards). Each card is either
+    {'kind': 'markdown', 'text': ...} or a pattern card
+    {'kind': 'pattern', 'type': ..., 'code': ..., 'id': n, 'size': (w, h)}.
+    Pattern ids count from 1 in page order, so SVG file names are stable
+    however the patterns end up being rendered.
+    """
+    with build_timing.phase('markdown-split'):
+        return _split_page_blocks(content)
+
+def _split_page_blocks(content):
     main_open, content_body, main_close = split_outer_main(content)
 
     # Split on 4 or more hyphens
     blocks = re.split(r'-{4,}', content_body)
-    
-    # Process each block
-    patterns = []
-    html_blocks = []
-    failed_patterns = []  # Track failed pattern generations
+
+    cards = []
     pattern_counter = 0
-    block_configs = {
-        ':patterning': {'size': (400, 400), 'store_code': True},
-        ':patterning-thumbnail': {'size': (200, 200), 'store_code': False},
-        ':patterning-small': {'size': (200, 200), 'store_code': True},
-    }
-    
     for block in blocks:
         block = block.strip()
         if not block:
             continue
-            
+
         # Check if this is a pattern block
         lines = block.split('\n')
         block_type = lines[0].strip()
-        if block_type in block_configs:
-            # This is a pattern block - collect all the code
-            pattern = '\n'.join(lines[1:]).strip()
-            if block_configs[block_type]['store_code']:
-                patterns.append({'id': None, 'code': pattern})
-            
-            # Generate SVG for this pattern with page name prefix
+        if block_type in BLOCK_CONFIGS:
             pattern_counter += 1
-            pattern_id = pattern_counter
-            svg_width, svg_height = block_configs[block_type]['size']
-            svg_path = generate_svg_for_pattern(pattern, pattern_id, output_dir, page_name, svg_width, svg_height)
-            if block_configs[block_type]['store_code']:
-                patterns[-1]['id'] = pattern_id
-            
+            cards.append({'kind': 'pattern',
+                          'type': block_type,
+                          'code': '\n'.join(lines[1:]).strip(),
+                          'id': pattern_counter,
+                          'size': BLOCK_CONFIGS[block_type]['size']})
+        else:
+            cards.append({'kind': 'markdown', 'text': block})
+    return main_open, main_close, cards
+
+def assemble_page(main_open, main_close, cards, output_dir, page_name, svg_paths):
+    """Turn split cards plus their rendered SVG paths (keyed by pattern id) into page HTML.
+
+    Each markdown card is converted in isolation so malformed HTML in one card
+    does not affect others.
+    """
+    patterns = []
+    html_blocks = []
+    failed_patterns = []  # Track failed pattern generations
+
+    for card in cards:
+        if card['kind'] == 'pattern':
+            pattern = card['code']
+            pattern_id = card['id']
+            block_type = card['type']
+            svg_path = svg_paths.get(pattern_id)
+            if BLOCK_CONFIGS[block_type]['store_code']:
+                patterns.append({'id': pattern_id, 'code': pattern})
+
             # Track failed patterns
             if not svg_path:
                 failed_patterns.append({
@@ -309,61 +578,60 @@ def process_blocks(content, output_dir, page_name, tutorial_root):
                     'pattern_code': pattern,
                     'expected_svg_path': os.path.join(output_dir, f'{page_name}-pattern-{pattern_id}.svg')
                 })
-            
+
             # Add a pattern example container
             svg_rel_path = os.path.basename(svg_path) if svg_path else None
             error_message = None if svg_path else "Error generating pattern preview"
-            container = render_pattern_container(pattern, pattern_id, svg_rel_path, block_type, error_message)
-            
-            html_blocks.append(container)
+            html_blocks.append(render_pattern_container(pattern, pattern_id, svg_rel_path, block_type, error_message))
         else:
-            # Convert markdown card in isolation.
-            markdown_block = convert_wiki_links(block)
+            markdown_block = convert_wiki_links(card['text'])
             markdown_block = enable_markdown_in_main_blocks(markdown_block)
             html_blocks.append(markdown_to_html(markdown_block))
 
     html_content = '\n\n'.join(html_blocks)
     if main_open and main_close:
         html_content = f"{main_open}\n{html_content}\n{main_close}"
-    
+
     return html_content, patterns, failed_patterns
 
-def generate_html_page(markdown_file, output_file, tutorial_root):
-    """Generate HTML page from markdown file with embedded pattern examples."""
-    # Read markdown content
-    with open(markdown_file, 'r') as f:
-        content = f.read()
-    
-    # Get title from first line of markdown (if it's a heading)
-    title = "Pattern Tutorial"
+def process_blocks(content, output_dir, page_name, tutorial_root, renderer=None, cache=None):
+    """Split a page into cards, render its patterns in order and assemble the HTML."""
+    main_open, main_close, cards = split_page_blocks(content)
+    svg_paths = {}
+    for card in cards:
+        if card['kind'] == 'pattern':
+            width, height = card['size']
+            svg_paths[card['id']] = generate_svg(card['code'], card['id'], output_dir, page_name,
+                                                 width, height, renderer, cache)
+    return assemble_page(main_open, main_close, cards, output_dir, page_name, svg_paths)
+
+def page_title(content):
+    """Title from the first line of the markdown, if it's a heading."""
     first_line = content.split('\n')[0]
     if first_line.startswith('# '):
-        title = first_line[2:].strip()
-    
-    # Get page name from the output file name (without extension) and sanitize it
+        return first_line[2:].strip()
+    return "Pattern Tutorial"
+
+def page_name_for(output_file):
+    """Page name from the output file name, safe to use as an SVG file name prefix."""
     page_name = os.path.splitext(os.path.basename(output_file))[0]
     # Remove spaces and other problematic characters for filenames, then convert to lowercase
-    page_name = re.sub(r'[^\w\-_]', '_', page_name).lower()
-    
-    # Create output directory for SVGs
-    output_dir = os.path.dirname(output_file)
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Process content and extract patterns
-    html_content, patterns, failed_patterns = process_blocks(content, output_dir, page_name, tutorial_root)
-    
-    # Generate HTML using template
-    template = Template(HTML_TEMPLATE)
-    html = template.render(
-        title=title,
-        content=html_content,
-        patterns=patterns
-    )
-    
-    # Write output file
-    with open(output_file, 'w') as f:
-        f.write(html)
-    
+    return re.sub(r'[^\w\-_]', '_', page_name).lower()
+
+def write_html_page(output_file, title, html_content, patterns, failed_patterns):
+    """Render the page template, write it out and report any failed patterns."""
+    with build_timing.phase('template-render'):
+        template = Template(HTML_TEMPLATE)
+        html = template.render(
+            title=title,
+            content=html_content,
+            patterns=patterns
+        )
+
+    with build_timing.phase('html-write'):
+        with open(output_file, 'w') as f:
+            f.write(html)
+
     # Print summary of failed patterns
     if failed_patterns:
         print(f"\n❌ FAILED PATTERNS in {os.path.basename(output_file)}:")
@@ -374,16 +642,63 @@ def generate_html_page(markdown_file, output_file, tutorial_root):
     else:
         print(f"✅ All patterns generated successfully for {os.path.basename(output_file)}")
 
+def generate_html_page(markdown_file, output_file, tutorial_root, renderer=None, cache=None):
+    """Generate HTML page from markdown file with embedded pattern examples."""
+    with build_timing.item('page', os.path.basename(output_file)):
+        _generate_html_page(markdown_file, output_file, tutorial_root, renderer, cache)
+
+def _generate_html_page(markdown_file, output_file, tutorial_root, renderer, cache):
+    with open(markdown_file, 'r') as f:
+        content = f.read()
+
+    title = page_title(content)
+    page_name = page_name_for(output_file)
+
+    # Create output directory for SVGs
+    output_dir = os.path.dirname(output_file)
+    os.makedirs(output_dir, exist_ok=True)
+
+    html_content, patterns, failed_patterns = process_blocks(content, output_dir, page_name, tutorial_root, renderer, cache)
+    write_html_page(output_file, title, html_content, patterns, failed_patterns)
+
 def main():
     import argparse
     parser = argparse.ArgumentParser(description='Generate HTML page with pattern editors from markdown')
-    parser.add_argument('input_file', help='Input markdown file')
-    parser.add_argument('output_file', help='Output HTML file')
+    parser.add_argument('input_file', help='Input markdown file, or a directory of markdown files')
+    parser.add_argument('output_file', help='Output HTML file, or an output directory when input is a directory')
     parser.add_argument('tutorial_root', help='Tutorial root path for SVG references')
+    parser.add_argument('--no-server', action='store_true',
+                        help='Start a fresh `lein run` for every pattern instead of one warm render server')
+    parser.add_argument('--no-cache', action='store_true', help='Re-render every pattern, ignoring the SVG cache')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Directory for cached SVGs')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_CACHE_MAX_MB,
+                        help='Evict least recently used SVGs once the cache grows past this size')
+    build_timing.add_arguments(parser)
     args = parser.parse_args()
-    
-    generate_html_page(args.input_file, args.output_file, args.tutorial_root)
-    print(f"Generated {args.output_file} from {args.input_file}")
+    build_timing.start('tutorial-page')
+
+    if os.path.isdir(args.input_file):
+        pages = [(os.path.join(args.input_file, name),
+                  os.path.join(args.output_file, os.path.splitext(name)[0] + '.html'))
+                 for name in sorted(os.listdir(args.input_file)) if name.endswith('.md')]
+    else:
+        pages = [(args.input_file, args.output_file)]
+
+    # The server starts lazily, so a build served entirely from cache never starts a JVM
+    renderer = None if args.no_server else RenderServer()
+    cache = None if args.no_cache else SvgCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+    try:
+        for input_file, output_file in pages:
+            print(f"Processing {input_file}...")
+            generate_html_page(input_file, output_file, args.tutorial_root, renderer, cache)
+            print(f"Generated {output_file} from {input_file}")
+    finally:
+        if renderer is not None:
+            renderer.close()
+        if cache is not None:
+            cache.prune()
+    if args.timings is not None:
+        build_timing.finish(args.timings)
 
 if __name__ == '__main__':
-    main() 
+    main()
@@ -0,0 +1,30 @@
+"""Tests for the tutorial build scripts. Run from the project root with:
+
+    python3 -m unittest discover tutorial
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import build_tutorial as bt
+import generate_pattern_page as gpp
+
+
+class BatchJobTest(unittest.TestCase):
+    def test_job_format_matches_cache_key(self):
+        # A batch build stores its SVGs under these keys, so they must be
+        # rendered in the format the keys are made for
+        card = {'code': '(poly 5 0.5 0 0 {})', 'size': (200, 200)}
+        job = bt.batch_job(0, card, 'HelloWorld-pattern-0.svg')
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = gpp.SvgCache(cache_dir, fingerprint='library')
+            self.assertEqual(cache.key(card['code'], 200, 200),
+                             gpp.pattern_key('library', card['code'], 200, 200, job['format']))
+        self.assertEqual([200, 200], job['size'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+"""Watch mode for tutorial authoring.
+
+After an initial incremental build, the sources directory is polled for
+changes. A saved page is re-split, only the pattern blocks whose code changed
+are re-rendered on a single warm render server, and the page is rewritten.
+A small preview HTTP server serves the output directory and tells any open
+pages to reload (via server-sent events) once the rebuild is done.
+"""
+
+import functools
+import os
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import build_tutorial as bt
+import generate_pattern_page as gpp
+
+RELOAD_PATH = '/__reload'
+RELOAD_SCRIPT = (f"<script>new EventSource('{RELOAD_PATH}').onmessage = "
+                 "function () { location.reload(); };</script>")
+
+
+class ReloadHub:
+    """Counts rebuilds and lets preview connections wait for the next one."""
+
+    def __init__(self):
+        self.version = 0
+        self.condition = threading.Condition()
+
+    def notify(self):
+        with self.condition:
+            self.version += 1
+            self.condition.notify_all()
+
+    def wait(self, seen, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != seen, timeout)
+            return self.version
+
+
+class PreviewHandler(SimpleHTTPRequestHandler):
+    """Serves the built tutorial, adding a reload hook to every HTML page."""
+
+    hub = None
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == RELOAD_PATH:
+            self.stream_reloads()
+        elif path.endswith('.html'):
+            self.send_html_with_reload(self.translate_path(path))
+        else:
+            super().do_GET()
+
+    def send_html_with_reload(self, file_path):
+        try:
+            with open(file_path, 'r') as f:
+                html = f.read()
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        # The hook is only added when previewing, never to the built files
+        if '</body>' in html:
+            html = html.replace('</body>', RELOAD_SCRIPT + '\n</body>', 1)
+        else:
+            html += RELOAD_SCRIPT
+        body = html.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_reloads(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        seen = self.hub.version
+        try:
+            while True:
+                version = self.hub.wait(seen, timeout=15)
+                if version != seen:
+                    seen = version
+                    self.wfile.write(b'data: reload\n\n')
+                else:
+                    # Keeps the connection alive and notices closed tabs
+                    self.wfile.write(b': keepalive\n\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_preview_server(out_dir, port, hub):
+    class Handler(PreviewHandler):
+        pass
+    Handler.hub = hub
+    handler = functools.partial(Handler, directory=out_dir)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Previewing at http://localhost:{port}/")
+    return server
+
+
+def source_state(sources_dir):
+    """Modification time and size of each markdown page, to spot saves cheaply."""
+    state = {}
+    for markdown_file in bt.source_files(sources_dir):
+        try:
+            st = os.stat(markdown_file)
+        except FileNotFoundError:
+            continue
+        state[markdown_file] = (st.st_mtime_ns, st.st_size)
+    return state
+
+
+def rebuild_page(markdown_file, out_dir, manifest, template_hash, fingerprint, renderer, cache):
+    """Rebuild one page against the in-memory manifest. Returns True if its output changed."""
+    try:
+        page = bt.read_page(markdown_file, out_dir)
+    except OSError as e:
+        # Editors often save by writing a new file and renaming it over the old one
+        print(f"Skipping {markdown_file}: {e}")
+        return False
+    bt.plan_incremental_build([page], out_dir, manifest, template_hash, fingerprint, remove_missing=False)
+    if page['up_to_date']:
+        return False
+    for card in page['cards']:
+        if card['kind'] == 'pattern' and card['id'] in page['pending']:
+            width, height = card['size']
+            # A broken pattern shows up as an error on the page rather than stopping the watch
+            page['svg_paths'][card['id']] = gpp.generate_svg(card['code'], card['id'], out_dir, page['page_name'],
+                                                             width, height, renderer, cache, halt_on_error=False)
+    bt.finish_page(page, out_dir)
+    manifest['pages'][os.path.basename(page['output_file'])] = bt.page_entry(page)
+    return True
+
+
+def watch_tutorial(sources_dir, out_dir, tutorial_root, port=8000, interval=0.2, cache=None, jobs=None):
+    """Build, then keep rebuilding changed pages and reloading the preview until interrupted."""
+    bt.build_tutorial(sources_dir, out_dir, tutorial_root, jobs=jobs, cache=cache, halt_on_error=False)
+
+    template_hash = bt.text_hash(gpp.HTML_TEMPLATE)
+    # The warm server keeps the library it started with, so the fingerprint is fixed too
+    fingerprint = cache.fingerprint if cache is not None else gpp.library_fingerprint()
+    manifest = bt.load_manifest(out_dir) or bt.build_manifest([], template_hash)
+    hub = ReloadHub()
+    preview = start_preview_server(out_dir, port, hub)
+    renderer = gpp.RenderServer()
+    # Start the JVM now rather than on the first save
+    renderer.start()
+
+    state = source_state(sources_dir)
+    print(f"Watching {sources_dir} for changes (Ctrl-C to stop)")
+    try:
+        while True:
+            time.sleep(interval)
+            new_state = source_state(sources_dir)
+            if new_state == state:
+                continue
+            started = time.time()
+            changed = False
+            for markdown_file in sorted(new_state):
+                if state.get(markdown_file) != new_state[markdown_file]:
+                    print(f"Changed: {markdown_file}")
+                    changed |= rebuild_page(markdown_file, out_dir, manifest, template_hash,
+                                            fingerprint, renderer, cache)
+            for markdown_file in set(state) - set(new_state):
+                page_file = os.path.splitext(os.path.basename(markdown_file))[0] + '.html'
+                entry = manifest['pages'].pop(page_file, None)
+                if entry is not None:
+                    bt.remove_page_outputs(out_dir, page_file, entry)
+                    changed = True
+            state = new_state
+            if changed:
+                bt.save_manifest(out_dir, manifest)
+                hub.notify()
+                print(f"Rebuilt in {time.time() - started:.2f}s")
+    except KeyboardInterrupt:
+        print("Stopping watch")
+    finally:
+        preview.shutdown()
+        renderer.close()
+        if cache is not None:
+            cache.prune()